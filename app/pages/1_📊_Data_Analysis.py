@@ -1,4 +1,7 @@
 """The module to display data analysis in the app."""
+import sys
+from pathlib import Path
+
 import folium
 import matplotlib.pyplot as plt
 import pandas as pd
@@ -7,6 +10,9 @@ import streamlit as st
 from streamlit_extras.switch_page_button import switch_page
 from streamlit_folium import folium_static
 
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from src.workbook import read_sheet
+
 st.set_page_config(page_title="Data Analysis", page_icon="📊")
 
 
@@ -31,11 +37,10 @@ def read_excel_file(excel_file: str) -> tuple:
 @st.cache_data()
 def preloaded():
     file_path = "../data/ChallengeXHEC23022024.xlsx"
-    excel_data = pd.ExcelFile(file_path)
 
-    jan24_df = pd.read_excel(excel_data, sheet_name="JAN24")
-    clients_df = pd.read_excel(excel_data, sheet_name="clients")
-    intervenants_df = pd.read_excel(excel_data, sheet_name="intervenants")
+    jan24_df = read_sheet("JAN24", file_path)
+    clients_df = read_sheet("clients", file_path)
+    intervenants_df = read_sheet("intervenants", file_path)
 
     return jan24_df, clients_df, intervenants_df
 
@@ -1,7 +1,14 @@
+import sys
+from pathlib import Path
+
 import pandas as pd
 import streamlit as st
 from utils_app import *
 
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from src.kpis import aggregate_kpis, daily_kpis
+from src.workbook import read_sheet
+
 st.set_page_config(page_title="Schedule optimiser", page_icon="🧑🏻‍💼")
 
 st.write("\n")
@@ -59,61 +66,13 @@ def get_commute_data(
     return commute_data_df
 
 
-def metrics_calculation(
-    df: pd.DataFrame, kind: str = "driving"
-) -> pd.DataFrame:
-    if not df.empty:
-        all_intervenant_agendas = []
-        for intervenant_id in df["ID Intervenant"].unique():
-            intervenant_agenda_commute = plot_agenda(
-                intervenant_id,
-                df,
-                commute_data_df,
-                kind=kind,
-                moto="aggregate",
-            )
-            all_intervenant_agendas.append(intervenant_agenda_commute)
-
-        temp = pd.concat(all_intervenant_agendas)
-
-        avg_commute = (
-            temp[(temp["Task"] == "Commute Time")]
-            .groupby(["Date", "ID Intervenant"])["Commute Time"]
-            .sum()
-            .groupby("Date")
-            .mean()
-            .mean()
-        )
-
-        avg_downtime = (
-            temp[(temp["Task"] == "Wait Time")]
-            .groupby(["Date", "ID Intervenant"])["Wait Time"]
-            .count()
-            .groupby("Date")
-            .mean()
-            .mean()
-        )
-
-        commute_given = temp.loc[
-            (temp["Task"] == "Commute Time")
-            & (temp["Commute Method"] == "driving"),
-            "Commute Meters",
-        ].sum()
-
-        return (
-            round(avg_commute, 2),
-            round(avg_downtime, 2),
-            round(commute_given / 1000, 2),
-        )
-
-    else:
-        return 0, 0, 0
-
-
-q1a = pd.read_csv("../results/question_1_a.csv")
-q1b = pd.read_csv("../results/question_1_b.csv")
-q2a = pd.read_csv("../results/question_2_a.csv")
-q2b = pd.read_csv("../results/question_2_b.csv")
+# result file and commute kind of every schedule
+SCHEDULES = {
+    "q1a": ("question_1_a", "driving"),
+    "q1b": ("question_1_b", "driving"),
+    "q2a": ("question_2_a", "license"),
+    "q2b": ("question_2_b", "license"),
+}
 
 commute_file_paths = [
     "../data/commute_bicycling_clients.csv",
@@ -124,45 +83,75 @@ commute_file_paths = [
     "../data/commute_driving_clients_care.csv",
 ]
 
-commute_data_df = get_commute_data(commute_file_paths)
-caregivers = pd.read_excel("../data/ChallengeXHEC23022024.xlsx", sheet_name=2)
 
-optimised_sched_q1a = preprocess_schedules(
-    q1a, caregivers, sched="optimised", kind="driving"
-)
+@st.cache_resource
+def load_commute_data() -> pd.DataFrame:
+    """Load the commute table once for all sessions of the app."""
+    return get_commute_data(commute_file_paths)
 
-optimised_sched_q1b = preprocess_schedules(
-    q1b, caregivers, sched="optimised", kind="driving"
-)
 
-optimised_sched_q2a = preprocess_schedules(
-    q2a, caregivers, sched="optimised", kind="license"
-)
+@st.cache_data
+def load_schedules() -> dict:
+    """Load and preprocess the given and optimised schedules once."""
+    caregivers = read_sheet(2, "../data/ChallengeXHEC23022024.xlsx")
+    schedules = {
+        name: preprocess_schedules(
+            pd.read_csv(f"../results/{file_name}.csv"),
+            caregivers,
+            sched="optimised",
+            kind=kind,
+        )
+        for name, (file_name, kind) in SCHEDULES.items()
+    }
+
+    schedule = read_sheet(0, "../data/ChallengeXHEC23022024.xlsx")
+    discard_list = [
+        "ADMINISTRATION",
+        "VISITE MEDICALE",
+        "FORMATION",
+        "COORDINATION",
+        "HOMMES TOUTES MAINS",
+    ]
+    schedule = schedule[~schedule.Prestation.isin(discard_list)]
+    given_sched = preprocess_schedules(
+        schedule, caregivers, sched="given", kind="driving"
+    )
+    given_sched["Date"] = pd.to_datetime(given_sched["Date"])
+    schedules["given"] = given_sched
+    return schedules
 
-optimised_sched_q2b = preprocess_schedules(
-    q2b, caregivers, sched="optimised", kind="license"
-)
 
-schedule = pd.read_excel("../data/ChallengeXHEC23022024.xlsx", sheet_name=0)
+@st.cache_data
+def load_daily_kpis() -> dict:
+    """Precompute the KPIs of every schedule by date and caregiver once."""
+    kinds = {name: kind for name, (_, kind) in SCHEDULES.items()}
+    kinds["given"] = "driving"
+    return {
+        name: daily_kpis(schedule, load_commute_data(), kind=kinds[name])
+        for name, schedule in load_schedules().items()
+    }
 
-discard_list = [
-    "ADMINISTRATION",
-    "VISITE MEDICALE",
-    "FORMATION",
-    "COORDINATION",
-    "HOMMES TOUTES MAINS",
-]
 
-schedule = schedule[~schedule.Prestation.isin(discard_list)]
-given_sched = preprocess_schedules(
-    schedule, caregivers, sched="given", kind="driving"
-)
+def metrics_calculation(
+    daily: pd.DataFrame, start_date: pd.Timestamp, end_date: pd.Timestamp
+) -> tuple:
+    dates = daily.index.get_level_values("Date")
+    kpis = aggregate_kpis(daily[(dates >= start_date) & (dates <= end_date)])
+    return (
+        round(kpis["commute_minutes"], 2),
+        round(kpis["short_downtimes"], 2),
+        round(kpis["driving_km"], 2),
+    )
+
+
+commute_data_df = load_commute_data()
+schedules = load_schedules()
+given_sched = schedules["given"]
 
 # Sidebar filters
 st.sidebar.header("Filters")
 
 # Start and end date filter
-given_sched["Date"] = pd.to_datetime(given_sched["Date"])
 min_date = given_sched["Date"].min()
 max_date = given_sched["Date"].max()
 start_date = pd.Timestamp(
@@ -194,45 +183,38 @@ selected_constraint = st.sidebar.selectbox(
 )
 
 # Intervenant filter
-caregiver_options = list(optimised_sched_q1a["ID Intervenant"].unique())
+caregiver_options = list(schedules["q1a"]["ID Intervenant"].unique())
 selected_caregiver = st.sidebar.selectbox("Caregiver", caregiver_options)
 
 # Apply date filters
-given_sched = given_sched[
-    (given_sched["Date"] >= start_date) & (given_sched["Date"] <= end_date)
-]
-optimised_sched_q1a = optimised_sched_q1a[
-    (optimised_sched_q1a["Date"] >= start_date)
-    & (optimised_sched_q1a["Date"] <= end_date)
-]
-optimised_sched_q1b = optimised_sched_q1b[
-    (optimised_sched_q1b["Date"] >= start_date)
-    & (optimised_sched_q1b["Date"] <= end_date)
-]
-optimised_sched_q2a = optimised_sched_q2a[
-    (optimised_sched_q2a["Date"] >= start_date)
-    & (optimised_sched_q2a["Date"] <= end_date)
-]
-optimised_sched_q2b = optimised_sched_q2b[
-    (optimised_sched_q2b["Date"] >= start_date)
-    & (optimised_sched_q2b["Date"] <= end_date)
-]
-
-# Compute key metrics
+schedules = {
+    name: schedule[
+        (schedule["Date"] >= start_date) & (schedule["Date"] <= end_date)
+    ]
+    for name, schedule in schedules.items()
+}
+given_sched = schedules["given"]
+optimised_sched_q1a = schedules["q1a"]
+optimised_sched_q1b = schedules["q1b"]
+optimised_sched_q2a = schedules["q2a"]
+optimised_sched_q2b = schedules["q2b"]
+
+# Slice the precomputed key metrics to the dates
+daily = load_daily_kpis()
 avg_commute_given, avg_wait_given, distance_given = metrics_calculation(
-    given_sched
+    daily["given"], start_date, end_date
 )
 avg_commute_q1a, avg_wait_q1a, distance_q1a = metrics_calculation(
-    optimised_sched_q1a
+    daily["q1a"], start_date, end_date
 )
 avg_commute_q1b, avg_wait_q1b, distance_q1b = metrics_calculation(
-    optimised_sched_q1b
+    daily["q1b"], start_date, end_date
 )
 avg_commute_q2a, avg_wait_q2a, distance_q2a = metrics_calculation(
-    optimised_sched_q2a, kind="license"
+    daily["q2a"], start_date, end_date
 )
 avg_commute_q2b, avg_wait_q2b, distance_q2b = metrics_calculation(
-    optimised_sched_q2b, kind="license"
+    daily["q2b"], start_date, end_date
 )
 
 
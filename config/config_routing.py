@@ -1,3 +1,5 @@
 GOOGLE_API = ""
 COMMUTE_METHOD = "driving"  # options are: driving, bicycling
 ROUTE_DIRECTION = "clients"  # options are: clients, care_client, client_care
+ROUTING_ENGINE = "google"  # options are: google, local
+ROAD_GRAPH_DIR = "data/road_graph"  # OSM graphs of the local routing engine
@@ -0,0 +1,100 @@
+import argparse
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from src.optimiser import ENGINES, CareScheduler
+from src.scheduler_data import SchedulerData
+
+
+def main(
+    days: list[str] = None,
+    engines: list[str] = ENGINES,
+    transport: str = "license",
+    time_limit: int = 1200,
+    backend: str = "cbc",
+) -> pd.DataFrame:
+    """Compare build time, solve time and objective of the engines by day.
+
+    Parameters:
+        days (list[str], optional): Days of january, e.g. "01". Defaults to all.
+        engines (list[str], optional): Engines to compare. Defaults to ENGINES.
+        transport (str, optional): Kind of caregiver transport. Defaults to "license".
+        time_limit (int, optional): Time limit per solve in seconds. Defaults to 1200.
+        backend (str, optional): Solver backend. Defaults to "cbc".
+
+    Returns:
+        pd.DataFrame: One row of statistics per day and engine.
+    """
+    data = SchedulerData.load(transport)
+    days = days or [f"{i:02d}" for i in range(1, 32)]
+
+    rows = []
+    for day in days:
+        for engine in engines:
+            start_time = time.perf_counter()
+            scheduler = CareScheduler(
+                date=f"2024-01-{day}",
+                transport=transport,
+                include_availability=True,
+                filter_for_competence=True,
+                engine=engine,
+                data=data,
+            )
+            build_time = time.perf_counter() - start_time
+            solve_stats = scheduler.solve(
+                time_limit=time_limit, backend=backend
+            )
+            print(f"2024-01-{day} {engine}: {solve_stats}")
+            rows.append(
+                {
+                    "date": f"2024-01-{day}",
+                    "engine": engine,
+                    "build_time": build_time,
+                    **solve_stats.to_dict(),
+                }
+            )
+
+    results = pd.DataFrame(rows)
+    results_dir = Path("results_new_client")
+    results_dir.mkdir(parents=True, exist_ok=True)
+    results.to_csv(results_dir / "benchmark_engines.csv", index=False)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the optimisation engines on january days."
+    )
+    parser.add_argument(
+        "--days",
+        nargs="+",
+        default=None,
+        help="Days of january, e.g. 01 02. Defaults to all days.",
+    )
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        default=ENGINES,
+        choices=ENGINES,
+        help="Engines to compare.",
+    )
+    parser.add_argument(
+        "--transport", type=str, default="license", help="Type of transport."
+    )
+    parser.add_argument(
+        "--time_limit", type=int, default=1200, help="Time limit for solver."
+    )
+    parser.add_argument(
+        "--solver", type=str, default="cbc", help="Solver backend."
+    )
+    args = parser.parse_args()
+
+    main(
+        days=args.days,
+        engines=args.engines,
+        transport=args.transport,
+        time_limit=args.time_limit,
+        backend=args.solver,
+    )
@@ -0,0 +1,324 @@
+import argparse
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.client_generator import add_new_clients_and_sessions
+from src.dataloader import build_schedule_df
+from src.instrumentation import model_size
+from src.kpis import schedule_kpis
+from src.optimiser import ENGINES, CareScheduler
+from src.scheduler_data import SchedulerData
+from src.utils import preprocess_schedules
+from src.workbook import read_sheet
+
+# multiples of the january client volume to benchmark
+SCALES = [1, 2, 5, 10]
+
+# timings compared between commits
+TIMINGS = ["build_time", "solve_time", "kpi_time"]
+
+
+def scale_data(
+    data: SchedulerData,
+    scale: int,
+    seed: int = 0,
+    excel_file: str = "data/ChallengeXHEC23022024.xlsx",
+) -> SchedulerData:
+    """Generate a scenario with a multiple of the january clients.
+
+    Synthetic clients are drawn with add_new_clients_and_sessions, which places
+    them at the location of an existing client of their segment. Caregivers are
+    cloned under new IDs with the home, skills, transport and availability of
+    the original, so that the commute matrices are extended by copies.
+
+    Parameters:
+        data (SchedulerData): Inputs of the january schedule.
+        scale (int): Multiple of the january clients and caregivers.
+        seed (int, optional): Seed of the client generator. Defaults to 0.
+        excel_file (str, optional): Excel file of the challenge. Defaults to
+            "data/ChallengeXHEC23022024.xlsx".
+
+    Returns:
+        SchedulerData: Inputs of the scaled scenario.
+    """
+    np.random.seed(seed)
+    if scale > 1:
+        _, sessions = add_new_clients_and_sessions(
+            n_clients=(scale - 1) * len(data.client_ids),
+            excel_file=excel_file,
+        )
+    else:
+        sessions = read_sheet(0, excel_file)
+
+    # clone caregivers under IDs that no client or caregiver uses
+    offset = int(data.commute_ids.max()) + 1
+
+    def clone(df: pd.DataFrame) -> pd.DataFrame:
+        return pd.concat(
+            [
+                df.assign(
+                    **{"ID Intervenant": df["ID Intervenant"] + copy * offset}
+                )
+                for copy in range(scale)
+            ],
+            ignore_index=True,
+        )
+
+    caregivers = clone(data.caregivers)
+    caregiver_ids = data.caregivers["ID Intervenant"].to_numpy()
+    clone_ids = caregivers["ID Intervenant"].to_numpy()[len(caregiver_ids) :]
+
+    # clones commute like the caregiver they were copied from
+    rows = np.concatenate(
+        [
+            np.arange(len(data.commute_ids)),
+            data.commute_positions(np.tile(caregiver_ids, scale - 1)),
+        ]
+    )
+    commute = {
+        name: matrix[np.ix_(rows, rows)]
+        for name, matrix in data.commute.items()
+    }
+
+    schedule = build_schedule_df(sessions, caregivers)
+    # dates as read back from data/schedule.csv
+    schedule["Date"] = pd.to_datetime(schedule["Date"]).dt.strftime("%Y-%m-%d")
+    return SchedulerData(
+        schedule,
+        caregivers,
+        data.client_ids,
+        clone(data.caregiver_transport),
+        clone(data.caregiver_avail),
+        np.concatenate([data.commute_ids, clone_ids]),
+        commute,
+        transport=data.transport,
+        clients=data.clients,
+    )
+
+
+def commute_frame(data: SchedulerData) -> pd.DataFrame:
+    """Get all known commutes of the data laid out as from get_commute_data."""
+    ids = data.commute_ids.astype(str)
+    frames = []
+    for kind in ["driving", "bicycling"]:
+        seconds = data.commute[f"{kind}_seconds"]
+        source, dest = np.nonzero(~np.isnan(seconds))
+        frames.append(
+            pd.DataFrame(
+                {
+                    "source": ids[source],
+                    "destination": ids[dest],
+                    "commute_method": kind,
+                    "commute_seconds": seconds[source, dest],
+                    "commute_meters": data.commute[f"{kind}_meters"][
+                        source, dest
+                    ],
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True).set_index(
+        ["source", "destination", "commute_method"]
+    )
+
+
+def current_commit() -> str:
+    """Get the short hash of HEAD, marked dirty with uncommitted changes."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        changes = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if changes else commit
+
+
+def main(
+    scales: list[int] = SCALES,
+    days: list[str] = None,
+    engines: list[str] = ["mip"],
+    transport: str = "license",
+    time_limit: int = 1200,
+    backend: str = "cbc",
+    mip_gap: float = 0.05,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Time model build, solve and KPI evaluation on scaled scenarios.
+
+    Results are saved per commit in results_new_client/benchmark_scale, and
+    the timings of all benchmarked commits are compared in comparison.csv.
+
+    Parameters:
+        scales (list[int], optional): Multiples of the january client volume.
+            Defaults to SCALES.
+        days (list[str], optional): Days of january, e.g. "02". Defaults to "02".
+        engines (list[str], optional): Engines to benchmark. Defaults to mip.
+        transport (str, optional): Kind of caregiver transport. Defaults to "license".
+        time_limit (int, optional): Time limit per solve in seconds. Defaults to 1200.
+        backend (str, optional): Solver backend. Defaults to "cbc".
+        mip_gap (float, optional): Relative mip gap to stop at. Defaults to 0.05.
+        seed (int, optional): Seed of the client generator. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: One row of statistics per scale, day and engine.
+    """
+    data = SchedulerData.load(transport)
+    days = days or ["02"]
+    commit = current_commit()
+    timestamp = datetime.now().isoformat(timespec="seconds")
+
+    rows = []
+    for scale in scales:
+        scenario = scale_data(data, scale, seed=seed)
+        commute_data_df = commute_frame(scenario)
+        for day in days:
+            for engine in engines:
+                start_time = time.perf_counter()
+                scheduler = CareScheduler(
+                    date=f"2024-01-{day}",
+                    transport=transport,
+                    include_availability=True,
+                    filter_for_competence=True,
+                    engine=engine,
+                    data=scenario,
+                )
+                build_time = time.perf_counter() - start_time
+
+                start_time = time.perf_counter()
+                solve_stats = scheduler.solve(
+                    time_limit=time_limit, backend=backend, mip_gap=mip_gap
+                )
+                solve_time = time.perf_counter() - start_time
+
+                start_time = time.perf_counter()
+                temp = scheduler.df_sessions.merge(
+                    scheduler.assignments(), how="left", on="idx"
+                )
+                kpis = schedule_kpis(
+                    preprocess_schedules(
+                        temp, scenario.caregivers.copy(), kind=transport
+                    ),
+                    commute_data_df,
+                    kind=transport,
+                )
+                kpi_time = time.perf_counter() - start_time
+
+                print(f"x{scale} 2024-01-{day} {engine}: {solve_stats}")
+                size = (
+                    model_size(scheduler.model)
+                    if scheduler.model is not None
+                    else {}
+                )
+                rows.append(
+                    {
+                        "commit": commit,
+                        "timestamp": timestamp,
+                        "scale": scale,
+                        "date": f"2024-01-{day}",
+                        "engine": engine,
+                        "sessions": int(
+                            (~scheduler.CAREGIVER_CASE_MASK).sum()
+                        ),
+                        "caregivers": len(scheduler.CAREGIVER_IDS),
+                        "build_time": build_time,
+                        "solve_time": solve_time,
+                        "kpi_time": kpi_time,
+                        **kpis.to_dict(),
+                        **size,
+                        **solve_stats.to_dict(),
+                    }
+                )
+
+    results = pd.DataFrame(rows)
+    results_dir = Path("results_new_client") / "benchmark_scale"
+    results_dir.mkdir(parents=True, exist_ok=True)
+    results.to_csv(results_dir / f"{commit}.csv", index=False)
+
+    # mean timings by scale of every benchmarked commit, oldest first
+    history = pd.concat(
+        [
+            pd.read_csv(path)
+            for path in results_dir.glob("*.csv")
+            if path.name != "comparison.csv"
+        ],
+        ignore_index=True,
+    ).sort_values("timestamp")
+    comparison = history.pivot_table(
+        index=["engine", "scale"],
+        columns="commit",
+        values=TIMINGS,
+        aggfunc="mean",
+        sort=False,
+    )
+    comparison.to_csv(results_dir / "comparison.csv")
+    print(comparison)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the scheduler on scaled client volumes."
+    )
+    parser.add_argument(
+        "--scales",
+        nargs="+",
+        type=int,
+        default=SCALES,
+        help="Multiples of the january client volume.",
+    )
+    parser.add_argument(
+        "--days",
+        nargs="+",
+        default=None,
+        help="Days of january, e.g. 02 03. Defaults to 02.",
+    )
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        default=["mip"],
+        choices=ENGINES,
+        help="Engines to benchmark.",
+    )
+    parser.add_argument(
+        "--transport", type=str, default="license", help="Type of transport."
+    )
+    parser.add_argument(
+        "--time_limit", type=int, default=1200, help="Time limit for solver."
+    )
+    parser.add_argument(
+        "--solver", type=str, default="cbc", help="Solver backend."
+    )
+    parser.add_argument(
+        "--mip_gap",
+        type=float,
+        default=0.05,
+        help="Relative mip gap every solve stops at.",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the client generator."
+    )
+    args = parser.parse_args()
+
+    main(
+        scales=args.scales,
+        days=args.days,
+        engines=args.engines,
+        transport=args.transport,
+        time_limit=args.time_limit,
+        backend=args.solver,
+        mip_gap=args.mip_gap,
+        seed=args.seed,
+    )
@@ -4,15 +4,15 @@ from scipy.stats import poisson
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 
+from src.workbook import read_sheet
+
 
 def get_client_segments(
     file_path: str = "data/ChallengeXHEC23022024.xlsx",
 ) -> pd.DataFrame:
     # Load data
-    excel_data = pd.ExcelFile(file_path)
-
-    jan24_df = pd.read_excel(excel_data, sheet_name="JAN24")
-    clients_df = pd.read_excel(excel_data, sheet_name="clients")
+    jan24_df = read_sheet("JAN24", file_path)
+    clients_df = read_sheet("clients", file_path)
 
     paris_center_coords = {"Latitude": 48.864716, "Longitude": 2.349014}
 
@@ -234,9 +234,9 @@ def add_new_clients_and_sessions(
         tuple[pd.DataFrame, pd.DataFrame]: Tuple of new Client DataFrame and new Sessions DataFrame
     """
     # Adding Clients
-    df_clients = pd.read_excel(excel_file, sheet_name=1)
-    intervenants_df = pd.read_excel(excel_file, sheet_name=2)
-    df_sessions = pd.read_excel(excel_file, sheet_name=0)
+    df_clients = read_sheet(1, excel_file)
+    intervenants_df = read_sheet(2, excel_file)
+    df_sessions = read_sheet(0, excel_file)
     client_segments = get_client_segments()
 
     # If we want random segments of clients
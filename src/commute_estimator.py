@@ -0,0 +1,143 @@
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_METERS = 6_371_000
+
+# detour over the great circle and commute speed used without calibration data
+DEFAULT_MODEL = {
+    "driving": {
+        "detour": 1.3,
+        "seconds_per_meter": 3.6 / 30,
+        "base_seconds": 0,
+    },
+    "bicycling": {
+        "detour": 1.2,
+        "seconds_per_meter": 3.6 / 15,
+        "base_seconds": 0,
+    },
+}
+
+
+def haversine_matrix(
+    origins: np.ndarray, destinations: np.ndarray
+) -> np.ndarray:
+    """Computes great-circle meters of all origins x destinations.
+
+    Parameters:
+    - origins (np.ndarray): Latitude and longitude of every origin.
+    - destinations (np.ndarray): Latitude and longitude of every destination.
+
+    Returns:
+    np.ndarray: Origins x destinations great-circle meters.
+    """
+    origins = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    destinations = np.radians(
+        np.asarray(destinations, dtype=float).reshape(-1, 2)
+    )
+    lat1, lon1 = origins[:, 0, None], origins[:, 1, None]
+    lat2, lon2 = destinations[None, :, 0], destinations[None, :, 1]
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class CommuteEstimator:
+    def __init__(self, model: dict = None) -> None:
+        """Estimate commutes from great-circle distances per commute method.
+
+        Meters are the great-circle meters times a detour factor, and seconds
+        are a base time plus seconds per meter of the estimated route.
+
+        Parameters:
+        - model (dict, optional): Detour, seconds_per_meter and base_seconds
+            by commute method. Defaults to DEFAULT_MODEL.
+        """
+        self.model = {**DEFAULT_MODEL, **(model or {})}
+
+    @classmethod
+    def fit(
+        cls,
+        coordinates: pd.DataFrame,
+        commute_ids: np.ndarray,
+        commute: dict[str, np.ndarray],
+    ) -> "CommuteEstimator":
+        """Calibrate the model of every method on the known commutes.
+
+        Parameters:
+        - coordinates (pd.DataFrame): Latitude and longitude by client and
+            caregiver ID, as from get_coordinates.
+        - commute_ids (np.ndarray): Client / caregiver IDs of the matrices.
+        - commute (dict[str, np.ndarray]): Commute matrices by name as from
+            load_commute_store.
+
+        Returns:
+        CommuteEstimator: Estimator with the detour factor fitted by least
+            squares through the origin, and seconds by a linear regression on
+            the route meters.
+        """
+        ids = coordinates.index.intersection(pd.Index(commute_ids))
+        positions = pd.Index(commute_ids).get_indexer(ids)
+        great_circle = haversine_matrix(
+            coordinates.loc[ids].to_numpy(), coordinates.loc[ids].to_numpy()
+        )
+
+        model = {}
+        for mode in DEFAULT_MODEL:
+            if f"{mode}_seconds" not in commute:
+                continue
+            seconds = commute[f"{mode}_seconds"][np.ix_(positions, positions)]
+            meters = commute[f"{mode}_meters"][np.ix_(positions, positions)]
+            known = (
+                (great_circle > 0)
+                & (meters > 0)
+                & ~np.isnan(meters)
+                & ~np.isnan(seconds)
+            )
+            if known.sum() < 2:
+                continue
+
+            x, road, time = (
+                great_circle[known],
+                meters[known].astype(float),
+                seconds[known].astype(float),
+            )
+            seconds_per_meter, base_seconds = np.polyfit(road, time, 1)
+            model[mode] = {
+                "detour": float((x * road).sum() / (x**2).sum()),
+                "seconds_per_meter": float(seconds_per_meter),
+                "base_seconds": float(max(base_seconds, 0)),
+            }
+            print(
+                f"Calibrated {mode} commutes on {known.sum()} pairs: "
+                f"detour {model[mode]['detour']:.2f}, "
+                f"{3.6 / seconds_per_meter:.1f} km/h"
+            )
+        return cls(model)
+
+    def estimate(
+        self, origins: np.ndarray, destinations: np.ndarray, mode: str
+    ) -> Tuple[np.ndarray]:
+        """Estimate the commute of all origins x destinations.
+
+        Parameters:
+        - origins (np.ndarray): Latitude and longitude of every origin.
+        - destinations (np.ndarray): Latitude and longitude of every
+            destination.
+        - mode (str): Commute method, driving or bicycling.
+
+        Returns:
+        Tuple[np.ndarray]: Origins x destinations seconds and meters, 0 for
+            the same location.
+        """
+        params = self.model[mode]
+        meters = params["detour"] * haversine_matrix(origins, destinations)
+        seconds = np.where(
+            meters > 0,
+            params["base_seconds"] + params["seconds_per_meter"] * meters,
+            0,
+        )
+        return seconds, meters
@@ -1,12 +1,21 @@
 import argparse
+import json
 import warnings
 from pathlib import Path
 from typing import Tuple
 
+import numpy as np
 import pandas as pd
 
 from config.availability import CAREGIVER_AVAILABILITY_DICT
 from src.client_generator import add_new_clients_and_sessions
+from src.routing_cache import (
+    RoutingCache,
+    commute_csvs,
+    get_coordinates,
+    id_coordinates,
+)
+from src.workbook import ingest_workbook, read_sheet
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
@@ -23,36 +32,46 @@ def load_data(excel_file: Path) -> Tuple[pd.DataFrame]:
         2. Clients DataFrame with client information.
         3. Caregivers DataFrame with caregiver information.
     """
-    schedule = pd.read_excel(excel_file, sheet_name=0)
-    clients = pd.read_excel(excel_file, sheet_name=1)
-    caregivers = pd.read_excel(excel_file, sheet_name=2)
+    schedule = read_sheet(0, excel_file)
+    clients = read_sheet(1, excel_file)
+    caregivers = read_sheet(2, excel_file)
 
     return schedule, clients, caregivers
 
 
 def create_commute_df(kind: str = "driving") -> None:
-    """Loads all the commute data and creates a whole df based on kind.
+    """Assembles all the commute data of a kind from the routing cache.
+
+    Fetched commute csvs that are new or changed since the last run are
+    imported into the routing cache first, commutes of new clients are added
+    to it by src/routing.py.
 
     Parameters:
     - kind (str): Kind of commute (either driving for all or by bicycling).
 
     Returns: None
     """
-    # loading and merging commute data
-    commute_file_paths = [
-        f"data/commute_{kind}_clients.csv",
-        f"data/commute_{kind}_care_clients.csv",
-        f"data/commute_{kind}_clients_care.csv",
-    ]
-    commute_dataframes = [pd.read_csv(file) for file in commute_file_paths]
-    for df in commute_dataframes:
-        if df.columns[0] != ["pair"]:  # standardizing column names
-            df.rename(columns={df.columns[0]: "pair"}, inplace=True)
-    commute_data_df = pd.concat(commute_dataframes, ignore_index=True)
+    clients_sheet = read_sheet(1)
+    caregivers = read_sheet(2)
+    clients = get_coordinates(clients_sheet, "ID Client")
+    caregiver_coords = get_coordinates(caregivers, "ID Intervenant")
+
+    cache = RoutingCache()
+    cache.seed(commute_csvs(kind), id_coordinates(clients_sheet, caregivers))
+
+    # all pairs of clients and caregivers
+    commute_data_df = pd.concat(
+        [
+            cache.table(clients, clients, kind),
+            cache.table(caregiver_coords, clients, kind),
+            cache.table(clients, caregiver_coords, kind),
+        ],
+        ignore_index=True,
+    )
+    print(f"Routing cache: {cache.stats()}")
+    cache.close()
 
     # create dummy commutes between the same caregivers home
-    caregivers = pd.read_excel("data/ChallengeXHEC23022024.xlsx", sheet_name=2)
-
     caregivers_commute = pd.DataFrame(
         {
             "source": caregivers["ID Intervenant"].unique(),
@@ -62,7 +81,9 @@ def create_commute_df(kind: str = "driving") -> None:
     caregivers_commute.insert(0, "commute_meters", 0)
     caregivers_commute.insert(0, "commute_seconds", 0)
     caregivers_commute.insert(
-        0, "pair", list(zip(caregivers_commute.source, df.destination))
+        0,
+        "pair",
+        list(zip(caregivers_commute.source, caregivers_commute.destination)),
     )
     caregivers_commute["commute_method"] = kind
 
@@ -78,6 +99,85 @@ def create_commute_df(kind: str = "driving") -> None:
     commute_data_df.to_csv(f"data/commute_{kind}_all.csv", index=False)
 
 
+def build_commute_store(
+    data_dir: str = "data",
+) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """Builds dense commute matrices of all kinds from the merged commute csvs.
+
+    Parameters:
+    - data_dir (str): Directory of the commute csvs.
+
+    Returns:
+    tuple[np.ndarray, dict[str, np.ndarray]]: IDs of the matrix rows and
+        columns, and float32 matrices (source x destination) of commute seconds
+        and meters per kind, e.g. "driving_seconds". Unknown commutes are NaN.
+    """
+    commute_dfs = {}
+    for kind in ["driving", "bicycling"]:
+        try:
+            commute_dfs[kind] = pd.read_csv(
+                f"{data_dir}/commute_{kind}_all.csv"
+            ).drop_duplicates(["source", "destination"])
+        except FileNotFoundError:
+            print(f"{kind.capitalize()} commute data not found")
+
+    ids = pd.unique(
+        np.concatenate(
+            [np.zeros(0, dtype=np.int64)]
+            + [
+                np.concatenate([df["source"], df["destination"]])
+                for df in commute_dfs.values()
+            ]
+        )
+    )
+    index = pd.Index(ids)
+
+    commute = {}
+    for kind in ["driving", "bicycling"]:
+        for unit in ["seconds", "meters"]:
+            matrix = np.full((len(ids), len(ids)), np.nan, dtype=np.float32)
+            if kind in commute_dfs:
+                df = commute_dfs[kind]
+                matrix[
+                    index.get_indexer(df["source"]),
+                    index.get_indexer(df["destination"]),
+                ] = df[f"commute_{unit}"].to_numpy(dtype=np.float32)
+            commute[f"{kind}_{unit}"] = matrix
+    return ids, commute
+
+
+def create_commute_store(data_dir: str = "data") -> None:
+    """Saves all commutes as compact matrices for the optimisation.
+
+    Parameters:
+    - data_dir (str): Directory of the commute csvs.
+
+    Returns: None
+    """
+    ids, commute = build_commute_store(data_dir)
+    np.savez(f"{data_dir}/commute_store.npz", ids=ids, **commute)
+
+
+def load_commute_store(
+    data_dir: str = "data",
+) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """Loads the commute matrices, building them if they were not saved.
+
+    Parameters:
+    - data_dir (str): Directory of the commute store.
+
+    Returns:
+    tuple[np.ndarray, dict[str, np.ndarray]]: IDs of the matrix rows and
+        columns and commute matrices by name as from build_commute_store.
+    """
+    try:
+        with np.load(f"{data_dir}/commute_store.npz") as store:
+            commute = {name: store[name] for name in store.files}
+    except FileNotFoundError:
+        return build_commute_store(data_dir)
+    return commute.pop("ids"), commute
+
+
 def create_schedule_df(generate_new_clients: bool, **kwargs) -> None:
     """Creates schedule data for optimisation for all days.
 
@@ -86,13 +186,69 @@ def create_schedule_df(generate_new_clients: bool, **kwargs) -> None:
     Returns: None
     """
     # load all necessary files
-    excel_file = Path("data/ChallengeXHEC23022024.xlsx")
-    schedule = pd.read_excel(excel_file, sheet_name=0)
-    caregivers = pd.read_excel(excel_file, sheet_name=2)
+    schedule = read_sheet(0)
+    caregivers = read_sheet(2)
 
     if generate_new_clients:
         _, schedule = add_new_clients_and_sessions(**kwargs)
 
+    schedule = build_schedule_df(schedule, caregivers)
+
+    # save data to csv and to the per-day store of the optimiser
+    schedule.to_csv("data/schedule.csv", index=False)
+    create_schedule_store(schedule)
+
+
+def create_schedule_store(
+    schedule: pd.DataFrame, data_dir: str = "data"
+) -> None:
+    """Saves the schedule as one Parquet file per day with an index.
+
+    Session times are stored as datetimes, so that the optimiser reads and
+    parses only the sessions of its own day.
+
+    Parameters:
+    - schedule (pd.DataFrame): Schedule of all days as from build_schedule_df.
+    - data_dir (str): Directory of the schedule store.
+
+    Returns: None
+    """
+    store_dir = Path(data_dir) / "schedule"
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    schedule = schedule.copy()
+    schedule["Date"] = pd.to_datetime(schedule["Date"]).dt.strftime("%Y-%m-%d")
+    n_sessions = {}
+    for date, df in schedule.groupby("Date"):
+        df.to_parquet(store_dir / f"{date}.parquet", index=False)
+        n_sessions[date] = len(df)
+
+    # remove days of previous schedules
+    for file in store_dir.glob("*.parquet"):
+        if file.stem not in n_sessions:
+            file.unlink()
+
+    index = {
+        "dates": n_sessions,
+        "max_idx": int(schedule["idx"].max()),
+        "columns": list(schedule.columns),
+    }
+    (store_dir / "index.json").write_text(json.dumps(index, indent=2))
+
+
+def build_schedule_df(
+    schedule: pd.DataFrame, caregivers: pd.DataFrame
+) -> pd.DataFrame:
+    """Builds the optimisation schedule from raw sessions.
+
+    Parameters:
+    - schedule (pd.DataFrame): Sessions as in the first sheet of the Excel file.
+    - caregivers (pd.DataFrame): Caregivers to add dummy sessions for.
+
+    Returns:
+    pd.DataFrame: Sessions and dummy caregiver sessions of all days with start
+        times and durations in minutes.
+    """
     # filter all data to contain only wanted prestation
     discard_list = [
         "ADMINISTRATION",
@@ -105,71 +261,48 @@ def create_schedule_df(generate_new_clients: bool, **kwargs) -> None:
 
     schedule = schedule.copy()
 
-    schedule["Heure de début"] = pd.to_datetime(
-        schedule["Date"].astype(str)
-        + " "
-        + schedule["Heure de début"].astype(str)
+    dates = pd.to_datetime(schedule["Date"])
+    schedule["Heure de début"] = dates + pd.to_timedelta(
+        schedule["Heure de début"].astype(str)
     )
-    schedule["Heure de fin"] = pd.to_datetime(
-        schedule["Date"].astype(str)
-        + " "
-        + schedule["Heure de fin"].astype(str)
+    schedule["Heure de fin"] = dates + pd.to_timedelta(
+        schedule["Heure de fin"].astype(str)
     )
 
-    for date in schedule.Date.unique():
-        # create dummy sessions for caregivers for beginning of day
-        before_first_client = caregivers[["ID Intervenant"]].copy()
-        before_first_client["ID Client"] = caregivers["ID Intervenant"]
-        before_first_client["Date"] = pd.to_datetime(date)
-        before_first_client["Heure de début"] = before_first_client[
-            "Date"
-        ] + pd.Timedelta(hours=5)
-        before_first_client["Heure de fin"] = before_first_client[
-            "Date"
-        ] + pd.Timedelta(hours=5)
-        before_first_client["Prestation"] = "COMMUTE"
-
-        # create dummy sessions for caregivers for end of day
-        after_last_client = caregivers[["ID Intervenant"]].copy()
-        after_last_client["ID Client"] = caregivers["ID Intervenant"]
-        after_last_client["Date"] = pd.to_datetime(date)
-        after_last_client["Heure de début"] = after_last_client[
-            "Date"
-        ] + pd.Timedelta(hours=22)
-        after_last_client["Heure de fin"] = after_last_client[
-            "Date"
-        ] + pd.Timedelta(hours=22)
-        after_last_client["Prestation"] = "COMMUTE"
-
-        schedule = pd.concat(
-            [schedule, before_first_client], ignore_index=True
-        )
-        schedule = pd.concat([schedule, after_last_client], ignore_index=True)
+    # create dummy sessions for caregivers at the beginning (5h) and end
+    # (22h) of every day
+    dummy_sessions = pd.DataFrame(
+        {
+            "Date": np.repeat(pd.to_datetime(schedule.Date.unique()), 2),
+            "Hour": np.tile([5, 22], schedule.Date.nunique()),
+        }
+    ).merge(caregivers[["ID Intervenant"]], how="cross")
+    dummy_sessions["ID Client"] = dummy_sessions["ID Intervenant"]
+    hours = pd.to_timedelta(dummy_sessions.pop("Hour"), unit="h")
+    dummy_sessions["Heure de début"] = dummy_sessions["Date"] + hours
+    dummy_sessions["Heure de fin"] = dummy_sessions["Heure de début"]
+    dummy_sessions["Prestation"] = "COMMUTE"
+
+    schedule = pd.concat([schedule, dummy_sessions], ignore_index=True)
 
     # sort values and create index for sessions
     schedule = schedule.sort_values(["Heure de début", "Heure de fin"])
     schedule = schedule.reset_index(drop=True)
     schedule["idx"] = schedule.index
 
-    # create session duration in minutes
+    # create session duration and start time in minutes
     schedule["Duration"] = (
         schedule["Heure de fin"] - schedule["Heure de début"]
-    )
-    schedule["Duration"] = schedule["Duration"].apply(
-        lambda x: x.seconds // 60
-    )
-
-    # create start time in minutes
+    ).dt.seconds // 60
     schedule["Start_time"] = (
         schedule["Heure de début"] - pd.to_datetime(schedule["Date"])
-    ).dt.seconds
-    schedule["Start_time"] = schedule["Start_time"].apply(lambda x: x // 60)
+    ).dt.seconds // 60
 
-    # drop caregiver to be sure
-    schedule = schedule.drop(columns="ID Intervenant")
-
-    # save data to csv
-    schedule.to_csv("data/schedule.csv", index=False)
+    # keep the given caregiver only as warm start of the optimisation
+    schedule = schedule.rename(
+        columns={"ID Intervenant": "Given_Caregiver_ID"}
+    )
+    return schedule
 
 
 def create_caregiver_availability() -> None:
@@ -194,8 +327,7 @@ def create_transport_possibilities(kind: str = "license") -> None:
 
     Returns: None
     """
-    excel_file = Path("data/ChallengeXHEC23022024.xlsx")
-    caregivers = pd.read_excel(excel_file, sheet_name=2)
+    caregivers = read_sheet(2)
 
     # get license information
     caregiver_transport = caregivers[["ID Intervenant", "Permis"]]
@@ -249,10 +381,12 @@ def get_commute_data(
 
 
 def load_and_save_data(generate_new_clients: bool = False, **kwargs) -> None:
+    ingest_workbook()
     create_schedule_df(generate_new_clients, **kwargs)
     create_caregiver_availability()
     create_commute_df(kind="driving")
     create_commute_df(kind="bicycling")
+    create_commute_store()
     create_transport_possibilities(kind="license")
     create_transport_possibilities(kind="driving")
 
@@ -0,0 +1,185 @@
+import time
+
+import numpy as np
+
+
+class LocalSearch:
+    def __init__(
+        self,
+        start_times: np.ndarray,
+        durations: np.ndarray,
+        commute: np.ndarray,
+        commute_bicycling: np.ndarray,
+        caregiver_drives: np.ndarray,
+        task_mask: np.ndarray,
+        routes: dict,
+        commute_meters: np.ndarray = None,
+    ) -> None:
+        """Relocate and swap local search on caregiver routes.
+
+        Routes are lists of case positions in visiting order, starting and
+        ending at the caregiver's dummy sessions. Moves are scored by the
+        objective of CareScheduler: commute minutes, 5 per downtime shorter
+        than 30 minutes and, with commute meters, driven kilometers.
+
+        Parameters:
+            start_times (np.ndarray): Start minute of every case.
+            durations (np.ndarray): Duration in minutes of every case.
+            commute (np.ndarray): Cases x cases car commute minutes.
+            commute_bicycling (np.ndarray): Cases x cases bicycle commute minutes.
+            caregiver_drives (np.ndarray): True for caregivers commuting by car.
+            task_mask (np.ndarray): Cases x caregivers, True if the caregiver can
+                take over the case.
+            routes (dict): Initial route of every caregiver position.
+            commute_meters (np.ndarray, optional): Cases x cases car commute
+                meters to include in the objective. Defaults to None.
+        """
+        self.start_times = start_times
+        self.end_times = start_times + durations
+        self.caregiver_drives = caregiver_drives
+        self.commute = commute
+        self.commute_bicycling = commute_bicycling
+        self.commute_meters = commute_meters
+        self.task_mask = task_mask
+        self.routes = {
+            caregiver: list(route) for caregiver, route in routes.items()
+        }
+        # visiting order of the cases
+        self.rank = np.empty(len(start_times), dtype=int)
+        self.rank[np.lexsort((self.end_times, start_times))] = np.arange(
+            len(start_times)
+        )
+        self.costs = {
+            caregiver: self.route_cost(caregiver, route)
+            for caregiver, route in self.routes.items()
+        }
+        self.n_moves = 0
+
+    @property
+    def objective(self) -> float:
+        """Objective of all routes."""
+        return sum(self.costs.values())
+
+    def route_cost(self, caregiver: int, route: list) -> float:
+        """Objective of a route, infinite if a connection doesn't fit."""
+        source = np.array(route[:-1], dtype=int)
+        dest = np.array(route[1:], dtype=int)
+        if self.caregiver_drives[caregiver]:
+            commute = self.commute[source, dest]
+        else:
+            commute = self.commute_bicycling[source, dest]
+
+        down_time = self.start_times[dest] - (self.end_times[source] + commute)
+        if not (down_time >= 0).all():
+            return np.inf
+
+        cost = commute.sum() + 5 * (down_time < 30).sum()
+        drives = self.caregiver_drives[caregiver]
+        if drives and self.commute_meters is not None:
+            cost += self.commute_meters[source, dest].sum() / 1000
+        return float(cost)
+
+    def _insert(self, route: list, case: int) -> list:
+        """Insert a case into a route by visiting order."""
+        return sorted(route + [case], key=self.rank.__getitem__)
+
+    def _apply(self, changed: dict, delta: float) -> bool:
+        """Apply the changed routes if they improve the objective."""
+        if delta >= -1e-9:
+            return False
+        for caregiver, (route, cost) in changed.items():
+            self.routes[caregiver] = route
+            self.costs[caregiver] = cost
+        self.n_moves += 1
+        return True
+
+    def insert(self, case: int) -> bool:
+        """Insert an unassigned case into the route where it costs least."""
+        best = None
+        for caregiver, route in self.routes.items():
+            if not self.task_mask[case, caregiver]:
+                continue
+            new_route = self._insert(route, case)
+            cost = self.route_cost(caregiver, new_route)
+            delta = cost - self.costs[caregiver]
+            if best is None or delta < best[0]:
+                best = (delta, caregiver, new_route, cost)
+
+        if best is None or np.isinf(best[0]):
+            return False
+        _, caregiver, route, cost = best
+        self.routes[caregiver] = route
+        self.costs[caregiver] = cost
+        return True
+
+    def relocate(self, case: int, source: int, dest: int) -> bool:
+        """Move a case from the route of one caregiver to another one."""
+        if not self.task_mask[case, dest]:
+            return False
+        source_route = [c for c in self.routes[source] if c != case]
+        dest_route = self._insert(self.routes[dest], case)
+        source_cost = self.route_cost(source, source_route)
+        dest_cost = self.route_cost(dest, dest_route)
+        delta = source_cost + dest_cost - self.costs[source] - self.costs[dest]
+        return self._apply(
+            {
+                source: (source_route, source_cost),
+                dest: (dest_route, dest_cost),
+            },
+            delta,
+        )
+
+    def swap(
+        self, case1: int, caregiver1: int, case2: int, caregiver2: int
+    ) -> bool:
+        """Exchange two cases between the routes of two caregivers."""
+        if not (
+            self.task_mask[case1, caregiver2]
+            and self.task_mask[case2, caregiver1]
+        ):
+            return False
+        route1 = self._insert(
+            [c for c in self.routes[caregiver1] if c != case1], case2
+        )
+        route2 = self._insert(
+            [c for c in self.routes[caregiver2] if c != case2], case1
+        )
+        cost1 = self.route_cost(caregiver1, route1)
+        cost2 = self.route_cost(caregiver2, route2)
+        delta = cost1 + cost2 - self.costs[caregiver1] - self.costs[caregiver2]
+        return self._apply(
+            {caregiver1: (route1, cost1), caregiver2: (route2, cost2)}, delta
+        )
+
+    def run(self, time_limit: float = 60) -> str:
+        """Apply improving moves until none is left or time is up.
+
+        Parameters:
+            time_limit (float, optional): Time limit in seconds. Defaults to 60.
+
+        Returns:
+            str: "locallyOptimal" or "maxTimeLimit".
+        """
+        deadline = time.perf_counter() + time_limit
+        improved = True
+        while improved:
+            improved = False
+            for source in list(self.routes):
+                # dummy sessions at both ends stay with their caregiver
+                for case in self.routes[source][1:-1]:
+                    for dest in self.routes:
+                        if time.perf_counter() > deadline:
+                            return "maxTimeLimit"
+                        if dest == source:
+                            continue
+                        if self.relocate(case, source, dest):
+                            improved = True
+                            break
+                        moved = False
+                        for other in self.routes[dest][1:-1]:
+                            if self.swap(case, source, other, dest):
+                                improved = moved = True
+                                break
+                        if moved:
+                            break
+        return "locallyOptimal"
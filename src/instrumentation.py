@@ -0,0 +1,77 @@
+import json
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Iterator
+
+import pyomo.environ as pe
+from pyomo.core.expr.visitor import identify_variables
+
+
+class PhaseTimer:
+    def __init__(self) -> None:
+        """Wall time in seconds of named phases of a run.
+
+        Repeated phases are summed. Phases may be nested, e.g. the _generate_*
+        helpers run while the model sets are built.
+        """
+        self.phases = {}
+        self._lap_start = time.perf_counter()
+
+    def add(self, name: str, seconds: float) -> None:
+        """Add seconds to the wall time of a phase."""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the body of a with statement."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start_time)
+
+    def lap(self, name: str = None) -> None:
+        """Record the time since the last lap, only restart it without name."""
+        now = time.perf_counter()
+        if name is not None:
+            self.add(name, now - self._lap_start)
+        self._lap_start = now
+
+
+def timed(method: Callable) -> Callable:
+    """Record the wall time of a method in the phases of self.timer."""
+
+    @wraps(method)
+    def wrapper(self: object, *args: object, **kwargs: object) -> object:
+        with self.timer.phase(method.__name__.lstrip("_")):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def model_size(model: pe.ConcreteModel) -> dict:
+    """Count variables, binaries, active constraints and their nonzeros."""
+    variables = list(model.component_data_objects(pe.Var))
+    constraints = list(
+        model.component_data_objects(pe.Constraint, active=True)
+    )
+    return {
+        "variables": len(variables),
+        "binaries": sum(var.is_binary() for var in variables),
+        "constraints": len(constraints),
+        "nonzeros": sum(
+            len(list(identify_variables(con.body, include_fixed=False)))
+            for con in constraints
+        ),
+    }
+
+
+def write_profile(record: dict, path: Path) -> None:
+    """Print a run record and append it as one JSON line."""
+    line = json.dumps(record, default=str)
+    print(line)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as file:
+        file.write(line + "\n")
@@ -0,0 +1,146 @@
+import pandas as pd
+
+from src.utils import compute_commute_and_wait_times
+
+# display names of the schedule KPIs
+KPI_NAMES = {
+    "commute_minutes": "Avg. Commute Time (min)",
+    "short_downtimes": "Avg nr short downtimes",
+    "driving_km": "Commute distance (km)",
+}
+
+
+def daily_kpis(
+    df: pd.DataFrame, commute_data_df: pd.DataFrame, kind: str = "license"
+) -> pd.DataFrame:
+    """Computes commute minutes, short downtimes and driving meters per day.
+
+    Commutes include the commute from home to the first session and from the
+    last session back home, as in the agenda of plot_agenda.
+
+    Parameters:
+        df (pd.DataFrame): Schedule as from preprocess_schedules.
+        commute_data_df (pd.DataFrame): All commutes as from get_commute_data.
+        kind (str, optional): Type of commute method to consider. Defaults to "license".
+
+    Returns:
+        pd.DataFrame: Commute minutes, number of short downtimes and driven
+            meters by date and caregiver.
+    """
+    df = compute_commute_and_wait_times(
+        df.dropna(subset=["ID Intervenant", "Date"]).copy(),
+        commute_data_df,
+        kind,
+    )
+    df["Short Downtime"] = df["Wait Time"] > 0
+    df["Driving Meters"] = df["Commute Meters"].where(
+        df["Commute Method"] == "driving", 0
+    )
+
+    # commute from the last session of the day back home
+    last = (
+        df.sort_values(
+            ["ID Intervenant", "Date", "Heure de début"], kind="stable"
+        )
+        .groupby(["ID Intervenant", "Date"], sort=False)
+        .tail(1)
+    )
+    keys = pd.MultiIndex.from_arrays(
+        [
+            last["ID Client"].astype(str),
+            last["ID Intervenant"].astype(str),
+            last["Commute Method"],
+        ]
+    )
+    commute = commute_data_df[["commute_seconds", "commute_meters"]]
+    if not commute.index.is_unique:
+        commute = commute[~commute.index.duplicated()]
+    home = commute.reindex(keys).fillna(0).set_axis(last.index)
+    df.loc[last.index, "Commute Time"] += home["commute_seconds"] / 60
+    df.loc[last.index, "Driving Meters"] += home["commute_meters"].where(
+        last["Commute Method"] == "driving", 0
+    )
+
+    daily = df.groupby(["Date", "ID Intervenant"]).agg(
+        commute_minutes=("Commute Time", "sum"),
+        short_downtimes=("Short Downtime", "sum"),
+        driving_meters=("Driving Meters", "sum"),
+    )
+    return daily
+
+
+def aggregate_kpis(daily: pd.DataFrame) -> pd.Series:
+    """Aggregates daily KPIs into the KPIs of a whole schedule.
+
+    Parameters:
+        daily (pd.DataFrame): KPIs by date and caregiver as from daily_kpis,
+            e.g. sliced to a date range.
+
+    Returns:
+        pd.Series: Average daily commute minutes and short downtimes per
+            caregiver, and driven kilometers, indexed like KPI_NAMES.
+    """
+    if daily.empty:
+        return pd.Series(0.0, index=list(KPI_NAMES))
+
+    by_date = daily.groupby(level="Date")
+    # downtimes are averaged over caregivers that have any, as in the agendas
+    with_downtimes = daily[daily["short_downtimes"] > 0]
+    return pd.Series(
+        {
+            "commute_minutes": by_date["commute_minutes"].mean().mean(),
+            "short_downtimes": with_downtimes.groupby(level="Date")[
+                "short_downtimes"
+            ]
+            .mean()
+            .mean(),
+            "driving_km": daily["driving_meters"].sum() / 1000,
+        }
+    )
+
+
+def schedule_kpis(
+    df: pd.DataFrame, commute_data_df: pd.DataFrame, kind: str = "license"
+) -> pd.Series:
+    """Computes the KPIs of a whole schedule.
+
+    Parameters:
+        df (pd.DataFrame): Schedule as from preprocess_schedules.
+        commute_data_df (pd.DataFrame): All commutes as from get_commute_data.
+        kind (str, optional): Type of commute method to consider. Defaults to "license".
+
+    Returns:
+        pd.Series: KPIs as from aggregate_kpis.
+    """
+    if df.empty:
+        return pd.Series(0.0, index=list(KPI_NAMES))
+    return aggregate_kpis(daily_kpis(df, commute_data_df, kind))
+
+
+def kpi_table(
+    schedules: dict[str, pd.DataFrame],
+    commute_data_df: pd.DataFrame,
+    kinds: dict[str, str] = None,
+) -> pd.DataFrame:
+    """Compares the KPIs of several schedules.
+
+    Parameters:
+        schedules (dict[str, pd.DataFrame]): Schedules by name as from
+            preprocess_schedules.
+        commute_data_df (pd.DataFrame): All commutes as from get_commute_data.
+        kinds (dict[str, str], optional): Type of commute method of each
+            schedule. Defaults to "license" for all.
+
+    Returns:
+        pd.DataFrame: KPIs by display name with one column per schedule.
+    """
+    kinds = kinds or {}
+    table = pd.DataFrame(
+        {
+            name: schedule_kpis(
+                schedule, commute_data_df, kinds.get(name, "license")
+            )
+            for name, schedule in schedules.items()
+        }
+    )
+    return table.rename(index=KPI_NAMES)
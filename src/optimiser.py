@@ -1,15 +1,30 @@
 import argparse
-import ast
+import copy
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from itertools import product
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import pyomo.environ as pe
 import pyomo.gdp as pyogdp
+from sklearn.cluster import KMeans
 
 from src.dataloader import get_commute_data
+from src.heuristic import LocalSearch
+from src.instrumentation import PhaseTimer, model_size, timed, write_profile
+from src.kpis import schedule_kpis
+from src.route_engine import RouteGeneration
+from src.scheduler_data import SchedulerData
+from src.solver import SOLVER_PLUGINS, ModelSolver, SolveStats
 from src.utils import plot_agenda, preprocess_schedules
 
+# engines solving the daily schedule
+ENGINES = ["mip", "heuristic", "routes"]
+
 
 class CareScheduler:
     def __init__(
@@ -19,83 +34,81 @@ class CareScheduler:
         transport: str = "driving",
         filter_for_competence: bool = False,
         carbon_reduction: bool = False,
+        prune_arcs: bool = True,
+        formulation: str = "bigm",
+        data: SchedulerData = None,
+        engine: str = "mip",
+        caregiver_ids: list = None,
+        client_ids: list = None,
     ) -> None:
         """Loading all necessary data."""
-        # load sessions and caregivers
-        try:
-            df_sessions = pd.read_csv("data/schedule.csv")
-            df_sessions = df_sessions[df_sessions.Date == date]
-            self.df_sessions = df_sessions
-        except FileNotFoundError:
-            print("Session data not found.")
-        try:
-            self.df_cargeivers = pd.read_excel(
-                "data/ChallengeXHEC23022024.xlsx", sheet_name=2
-            )
-        except FileNotFoundError:
-            print("Caregiver data not found")
-
-        # load commute data
-        try:
-            self.df_commute = pd.read_csv("data/commute_driving_all.csv")
-        except FileNotFoundError:
-            print("Commute data not found")
-        try:
-            self.df_commute_bicycling = pd.read_csv(
-                "data/commute_bicycling_all.csv"
-            )
-        except FileNotFoundError:
-            print("Bicycling commute data not found")
-        try:
-            self.df_caregiver_transport = pd.read_csv(
-                f"data/caregiver_transport_{transport}.csv"
-            )
-        except FileNotFoundError:
-            print("Caregiver transport data not found")
+        # wall time of the build phases
+        self.timer = PhaseTimer()
+        if formulation not in ("bigm", "linear"):
+            raise ValueError(f"Unknown formulation: {formulation}")
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
+
+        # load all inputs unless they are shared by the caller
+        if data is None:
+            data = SchedulerData.load(transport)
+        elif data.transport != transport:
+            raise ValueError(
+                f"Data was loaded for transport {data.transport}, not {transport}"
+            )
+        self.data = data
+        self.date = date
+        self.df_sessions = data.sessions_for(date)
+        self.df_cargeivers = data.caregivers
+        self.df_caregiver_transport = data.caregiver_transport
 
         # filter for availability
-        if include_availability:
-            try:
-                # load days where caregiver is not available
-                df_caregiver_avail = pd.read_csv(
-                    "data/caregiver_avail.csv",
-                    converters={
-                        "ID Intervenant": ast.literal_eval,
-                        "UNDISP_DAYS": ast.literal_eval,
-                    },
-                )
+        if include_availability and data.caregiver_avail is None:
+            print("Caregiver availability data not found")
+        elif include_availability:
+            # days where caregiver is not available
+            df_caregiver_avail = data.caregiver_avail
+
+            # filter caregivers df based on availability
+            day = (
+                pd.to_datetime(self.df_sessions["Heure de début"]).iloc[0].day
+            )
+            caregivers = []
+            for caregiver in self.df_cargeivers["ID Intervenant"].to_list():
+                if (
+                    day
+                    not in df_caregiver_avail.loc[
+                        df_caregiver_avail["ID Intervenant"] == caregiver,
+                        "UNDISP_DAYS",
+                    ].iloc[0]
+                ):
+                    caregivers.append(caregiver)
+            self.df_cargeivers = self.df_cargeivers[
+                self.df_cargeivers["ID Intervenant"].isin(caregivers)
+            ]
 
-                # filter caregivers df based on availability
-                day = (
-                    pd.to_datetime(self.df_sessions["Heure de début"])
-                    .iloc[0]
-                    .day
+            # filter sessions to exclude COMMUTE of unavailable caregivers
+            self.df_sessions = self.df_sessions[
+                self.df_sessions["ID Client"].isin(
+                    caregivers + data.client_ids
                 )
-                caregivers = []
-                for caregiver in self.df_cargeivers[
-                    "ID Intervenant"
-                ].to_list():
-                    if (
-                        day
-                        not in df_caregiver_avail.loc[
-                            df_caregiver_avail["ID Intervenant"] == caregiver,
-                            "UNDISP_DAYS",
-                        ].iloc[0]
-                    ):
-                        caregivers.append(caregiver)
-                self.df_cargeivers = self.df_cargeivers[
-                    self.df_cargeivers["ID Intervenant"].isin(caregivers)
-                ]
+            ]
 
-                # filter sessions to exclude COMMUTE of unavailable caregivers
-                clients = pd.read_excel(
-                    "data/ChallengeXHEC23022024.xlsx", sheet_name=1
-                )["ID Client"].to_list()
-                self.df_sessions = self.df_sessions[
-                    self.df_sessions["ID Client"].isin(caregivers + clients)
-                ]
-            except FileNotFoundError:
-                print("Caregiver availability data not found")
+        # restrict to the caregivers and clients of one cluster
+        is_dummy = self.df_sessions["ID Client"].isin(
+            data.caregivers["ID Intervenant"]
+        )
+        if caregiver_ids is not None:
+            self.df_cargeivers = self.df_cargeivers[
+                self.df_cargeivers["ID Intervenant"].isin(caregiver_ids)
+            ]
+            self.df_sessions = self.df_sessions[
+                ~is_dummy | self.df_sessions["ID Client"].isin(caregiver_ids)
+            ]
+        if client_ids is not None:
+            self.df_sessions = self.df_sessions[
+                is_dummy | self.df_sessions["ID Client"].isin(client_ids)
+            ]
 
         # filter for caregivers' skills at each prestation
         self.filter_for_competence = filter_for_competence
@@ -118,14 +131,29 @@ class CareScheduler:
 
         # set to include carbon emission in objective function
         self.carbon_reduction = carbon_reduction
-        self.model = self.create_model()
 
+        # drop case connections that can never be assigned in time
+        self.prune_arcs = prune_arcs
+        # model no case overlap as gdp disjunction or linear constraints
+        self.formulation = formulation
+        # solve with the pyomo model, the heuristic or route generation
+        self.engine = engine
+        self._build_index_arrays()
+        self._build_commute_arrays()
+        self.model = self.create_model() if engine == "mip" else None
+        # assignment merged by reoptimise
+        self.incumbent = None
+        # caregivers of the day after reoptimise, the model is then stale
+        self.reoptimised_caregivers = None
+
+    @timed
     def _generate_case_durations(self) -> dict:
         """Generate case duration for every case."""
         return pd.Series(
             self.df_sessions["Duration"].values, index=self.df_sessions["idx"]
         ).to_dict()
 
+    @timed
     def _generate_start_time(self) -> dict:
         """Generate case start time for every case."""
         return pd.Series(
@@ -133,235 +161,262 @@ class CareScheduler:
             index=self.df_sessions["idx"],
         ).to_dict()
 
+    def _generate_commute(self, matrix: str, divisor: float = 1) -> dict:
+        """Generate commute between all clients and caregivers of the day."""
+        clients = self.df_sessions["ID Client"].unique()
+        positions = self.data.commute_positions(clients)
+        commute = (
+            self.data.commute[matrix][np.ix_(positions, positions)].astype(
+                float
+            )
+            / divisor
+        )
+
+        # no commute between different caregivers
+        is_caregiver = np.isin(clients, self.CAREGIVER_IDS)
+        keep = ~(
+            is_caregiver[:, None]
+            & is_caregiver[None, :]
+            & ~np.eye(len(clients), dtype=bool)
+        )
+        if np.isnan(commute[keep]).any():
+            source, dest = np.argwhere(keep & np.isnan(commute))[0]
+            raise KeyError(
+                f"No commute data from {clients[source]} to {clients[dest]}"
+            )
+
+        source, dest = np.nonzero(keep)
+        return dict(
+            zip(
+                zip(clients[source].tolist(), clients[dest].tolist()),
+                commute[source, dest].tolist(),
+            )
+        )
+
+    @timed
     def _generate_clients_commute(self) -> dict:
         """Generate car commute between all clients and caregivers."""
-        clients_commute = {}
-        cargivers = self.df_cargeivers["ID Intervenant"].to_list()
-        for source, dest in product(
-            self.df_sessions["ID Client"].unique(),
-            self.df_sessions["ID Client"].unique(),
-        ):
-            if (
-                (source in cargivers)
-                and (dest in cargivers)
-                and (source != dest)
-            ):
-                continue
-
-            clients_commute[(source, dest)] = self.df_commute.loc[
-                (self.df_commute.source == source)
-                & (self.df_commute.destination == dest),
-                "commute_minutes",
-            ].iloc[0]
-        return clients_commute
+        return self._generate_commute("driving_seconds", divisor=60)
 
+    @timed
     def _generate_clients_commute_bicycling(self) -> dict:
         """Generate bicycle commute between all clients and caregivers."""
-        clients_commute_bicycling = {}
-        cargivers = self.df_cargeivers["ID Intervenant"].to_list()
-        for source, dest in product(
-            self.df_sessions["ID Client"].unique(),
-            self.df_sessions["ID Client"].unique(),
-        ):
-            if (
-                (source in cargivers)
-                and (dest in cargivers)
-                and (source != dest)
-            ):
-                continue
-
-            clients_commute_bicycling[
-                (source, dest)
-            ] = self.df_commute_bicycling.loc[
-                (self.df_commute_bicycling.source == source)
-                & (self.df_commute_bicycling.destination == dest),
-                "commute_minutes",
-            ].iloc[
-                0
-            ]
-        return clients_commute_bicycling
+        return self._generate_commute("bicycling_seconds", divisor=60)
 
+    @timed
     def _generate_commute_car_meters(self) -> dict:
         """Generate commute meters by car between all clients and caregivers."""
-        clients_commute = {}
-        cargivers = self.df_cargeivers["ID Intervenant"].to_list()
-        for source, dest in product(
-            self.df_sessions["ID Client"].unique(),
-            self.df_sessions["ID Client"].unique(),
-        ):
-            if (
-                (source in cargivers)
-                and (dest in cargivers)
-                and (source != dest)
-            ):
-                continue
-
-            clients_commute[(source, dest)] = self.df_commute.loc[
-                (self.df_commute.source == source)
-                & (self.df_commute.destination == dest),
-                "commute_meters",
-            ].iloc[0]
-        return clients_commute
+        return self._generate_commute("driving_meters")
 
+    @timed
     def _idx_clients_match(self) -> dict:
         """Get clients'/caregivers' ids for each case."""
         return pd.Series(
             self.df_sessions["ID Client"].values, index=self.df_sessions["idx"]
         ).to_dict()
 
-    def _generate_disjunctions(self) -> list[tuple]:
-        """Generate combinations of client routes and caregivers."""
-        cases = self.df_sessions["idx"].to_list()
-        cargivers = self.df_cargeivers["ID Intervenant"].to_list()
-        disjunctions = []
-        for (case1, case2, caregiver) in product(cases, cases, cargivers):
-            if (
-                self.df_sessions.loc[
-                    self.df_sessions["idx"] == case1, "ID Client"
-                ].iloc[0]
-                in cargivers
-            ) & (
-                self.df_sessions.loc[
-                    self.df_sessions["idx"] == case2, "ID Client"
-                ].iloc[0]
-                in cargivers
-            ):
+    @timed
+    def _build_index_arrays(self) -> None:
+        """Precompute array views of cases, clients and caregivers."""
+        self.CASE_IDS = self.df_sessions["idx"].to_numpy()
+        self.CASE_CLIENTS = self.df_sessions["ID Client"].to_numpy()
+        self.CAREGIVER_IDS = self.df_cargeivers["ID Intervenant"].to_numpy()
+        self.START_TIMES = self.df_sessions["Start_time"].to_numpy()
+        self.DURATIONS = self.df_sessions["Duration"].to_numpy()
+
+        # transport mode of caregivers, True if driving
+        self.CAREGIVER_DRIVES = (
+            self.df_caregiver_transport.set_index("ID Intervenant")
+            .loc[self.CAREGIVER_IDS, "Permis"]
+            .to_numpy(dtype=bool)
+        )
 
-                if (
-                    self.df_sessions.loc[
-                        self.df_sessions["idx"] == case1, "ID Client"
-                    ].iloc[0]
-                    != caregiver
-                ) | (
-                    self.df_sessions.loc[
-                        self.df_sessions["idx"] == case2, "ID Client"
-                    ].iloc[0]
-                    != caregiver
-                ):
-                    continue
-
-            if (
-                self.df_sessions.loc[
-                    self.df_sessions["idx"] == case1, "ID Client"
-                ].iloc[0]
-                in cargivers
-            ) & (
-                not (
-                    self.df_sessions.loc[
-                        self.df_sessions["idx"] == case2, "ID Client"
-                    ].iloc[0]
-                    in cargivers
-                )
-            ):
-                if (
-                    self.df_sessions.loc[
-                        self.df_sessions["idx"] == case1, "ID Client"
-                    ].iloc[0]
-                    != caregiver
-                ):
-                    continue
+        # bitmask of cases that are dummy sessions of any caregiver
+        self.CAREGIVER_CASE_MASK = np.isin(
+            self.CASE_CLIENTS, self.CAREGIVER_IDS
+        )
+        # cases x caregivers, True if the case is the caregiver's own dummy
+        own_case = self.CASE_CLIENTS[:, None] == self.CAREGIVER_IDS[None, :]
 
-            if (
-                not (
-                    self.df_sessions.loc[
-                        self.df_sessions["idx"] == case1, "ID Client"
-                    ].iloc[0]
-                    in cargivers
-                )
-            ) & (
-                self.df_sessions.loc[
-                    self.df_sessions["idx"] == case2, "ID Client"
-                ].iloc[0]
-                in cargivers
-            ):
-                if (
-                    self.df_sessions.loc[
-                        self.df_sessions["idx"] == case2, "ID Client"
-                    ].iloc[0]
-                    != caregiver
-                ):
-                    continue
-            if self.filter_for_competence:
-                if (
-                    self.SESSION_PRESTATION[case1]
-                    not in self.CAREGIVER_COMPETENCE[caregiver]
-                    or self.SESSION_PRESTATION[case2]
-                    not in self.CAREGIVER_COMPETENCE[caregiver]
-                ):
-                    continue
+        # cases x caregivers, True if the caregiver can take over the case
+        self.TASK_MASK = ~self.CAREGIVER_CASE_MASK[:, None] | own_case
+        if self.filter_for_competence:
+            self.TASK_MASK &= self._competence_matrix()
+
+    @timed
+    def _build_commute_arrays(self) -> None:
+        """Precompute commute parameters and cases x cases commute matrices."""
+        self.CLIENTS_COMMUTE = self._generate_clients_commute()
+        self.CLIENTS_COMMUTE_BICYCLING = (
+            self._generate_clients_commute_bicycling()
+        )
+        self.COMMUTE_CAR_METERS = self._generate_commute_car_meters()
+
+        self.CASE_COMMUTE = self._case_commute_matrix(
+            "driving_seconds", divisor=60
+        )
+        self.CASE_COMMUTE_BICYCLING = self._case_commute_matrix(
+            "bicycling_seconds", divisor=60
+        )
+        self.CASE_COMMUTE_METERS = self._case_commute_matrix("driving_meters")
+
+    def _case_commute_matrix(
+        self, matrix: str, divisor: float = 1
+    ) -> np.ndarray:
+        """Generate cases x cases commute matrix (NaN if missing)."""
+        positions = self.data.commute_positions(self.CASE_CLIENTS)
+        return (
+            self.data.commute[matrix][np.ix_(positions, positions)].astype(
+                float
+            )
+            / divisor
+        )
 
-            if case1 <= case2:
-                disjunctions.append((case1, case2, caregiver))
+    def _feasible_arcs_mask(self) -> np.ndarray:
+        """Generate cases x cases x caregivers mask of arcs that fit in time.
+
+        A case connection can only be assigned if one of the cases ends early
+        enough to commute to the other one with the caregiver's transport.
+        """
+        case_end = self.START_TIMES + self.DURATIONS
+        feasible = []
+        for commute in (self.CASE_COMMUTE_BICYCLING, self.CASE_COMMUTE):
+            forward = case_end[:, None] + commute <= self.START_TIMES[None, :]
+            backward = (
+                case_end[None, :] + commute.T <= self.START_TIMES[:, None]
+            )
+            feasible.append(forward | backward)
 
-        return disjunctions
+        return np.where(
+            self.CAREGIVER_DRIVES[None, None, :],
+            feasible[1][:, :, None],
+            feasible[0][:, :, None],
+        )
 
-    def _generate_tasks(self) -> list[tuple]:
-        """Generate combinations of cases and caregivers."""
-        cases = self.df_sessions["idx"].to_list()
-        cargivers = self.df_cargeivers["ID Intervenant"].to_list()
-        tasks = []
-        for (case, caregiver) in product(cases, cargivers):
-            if (
-                self.df_sessions.loc[
-                    self.df_sessions["idx"] == case, "ID Client"
-                ].iloc[0]
-                in cargivers
-            ):
-                if (
-                    self.df_sessions.loc[
-                        self.df_sessions["idx"] == case, "ID Client"
-                    ].iloc[0]
-                    != caregiver
-                ):
-                    continue
-            # Filter out task combination if the caregiver doesn't have the competence
-            if self.filter_for_competence:
-                if (
-                    self.SESSION_PRESTATION[case]
-                    not in self.CAREGIVER_COMPETENCE[caregiver]
-                ):
-                    continue
+    @timed
+    def _build_arc_indexes(self, arcs: list[tuple]) -> None:
+        """Index case connections by source and destination case."""
+        case_clients = dict(
+            zip(self.CASE_IDS.tolist(), self.CASE_CLIENTS.tolist())
+        )
+        self.ARCS_FROM = defaultdict(list)
+        self.ARCS_TO = defaultdict(list)
+        self.ARCS_FROM_CAREGIVER = defaultdict(list)
+        self.ARCS_TO_CAREGIVER = defaultdict(list)
+        # connections leaving or entering any dummy session of the caregiver
+        self.ARCS_FROM_HOME = defaultdict(list)
+        self.ARCS_TO_HOME = defaultdict(list)
+        for arc in arcs:
+            case1, case2, caregiver = arc
+            self.ARCS_FROM[case1].append(arc)
+            self.ARCS_TO[case2].append(arc)
+            self.ARCS_FROM_CAREGIVER[(case1, caregiver)].append(arc)
+            self.ARCS_TO_CAREGIVER[(case2, caregiver)].append(arc)
+            if case_clients[case1] == caregiver:
+                self.ARCS_FROM_HOME[caregiver].append(arc)
+            if case_clients[case2] == caregiver:
+                self.ARCS_TO_HOME[caregiver].append(arc)
+
+    def _fix_overlapping_arcs(self, model: pe.ConcreteModel) -> None:
+        """Linear replacement of the no case overlap disjunction.
+
+        Start times and durations are parameters, so for every case connection
+        the precedence constraints of both orderings are constant. The tightest
+        big-M of a precedence constraint is its violation: connections where
+        one ordering fits need no constraint and connections where both
+        orderings overlap are fixed to zero.
+        """
+        feasible = self._feasible_arcs_mask()
+        case_position = {case: pos for pos, case in enumerate(self.CASE_IDS)}
+        caregiver_position = {
+            caregiver: pos for pos, caregiver in enumerate(self.CAREGIVER_IDS)
+        }
+        for case1, case2, caregiver in model.DISJUNCTIONS:
+            if not feasible[
+                case_position[case1],
+                case_position[case2],
+                caregiver_position[caregiver],
+            ]:
+                model.SESSION_ASSIGNED[case1, case2, caregiver].fix(0)
+
+    def _competence_matrix(self) -> np.ndarray:
+        """Generate cases x caregivers matrix of caregivers' competences."""
+        prestations = np.array(
+            [self.SESSION_PRESTATION[case] for case in self.CASE_IDS],
+            dtype=object,
+        )
+        unique_prestations, inverse = np.unique(
+            prestations, return_inverse=True
+        )
+        competence = np.array(
+            [
+                [
+                    prestation in self.CAREGIVER_COMPETENCE[caregiver]
+                    for caregiver in self.CAREGIVER_IDS
+                ]
+                for prestation in unique_prestations
+            ],
+            dtype=bool,
+        ).reshape(len(unique_prestations), len(self.CAREGIVER_IDS))
+        return competence[inverse]
 
-            tasks.append((case, caregiver))
+    @timed
+    def _generate_disjunctions(self) -> list[tuple]:
+        """Generate combinations of client routes and caregivers."""
+        # both cases need to be possible for the caregiver
+        mask = self.TASK_MASK[:, None, :] & self.TASK_MASK[None, :, :]
+        mask &= (self.CASE_IDS[:, None] <= self.CASE_IDS[None, :])[:, :, None]
+        if self.prune_arcs:
+            n_arcs = mask.sum()
+            mask &= self._feasible_arcs_mask()
+            self.n_pruned_arcs = int(n_arcs - mask.sum())
+            # every arc carries two binaries and a disjunction with two
+            # indicator binaries after the big-M transformation
+            print(
+                f"Pruned {self.n_pruned_arcs} of {n_arcs} case connections: "
+                f"{4 * self.n_pruned_arcs} binaries and "
+                f"{self.n_pruned_arcs} big-M disjunctions removed"
+            )
+        case1, case2, caregiver = np.nonzero(mask)
+        return list(
+            zip(
+                self.CASE_IDS[case1].tolist(),
+                self.CASE_IDS[case2].tolist(),
+                self.CAREGIVER_IDS[caregiver].tolist(),
+            )
+        )
 
-        return tasks
+    @timed
+    def _generate_tasks(self) -> list[tuple]:
+        """Generate combinations of cases and caregivers."""
+        case, caregiver = np.nonzero(self.TASK_MASK)
+        return list(
+            zip(
+                self.CASE_IDS[case].tolist(),
+                self.CAREGIVER_IDS[caregiver].tolist(),
+            )
+        )
 
+    @timed
     def _case_combinations(self) -> list[tuple]:
         """Generate combinations of cases (client routes)."""
-        cases = self.df_sessions["idx"].unique()
-        cargivers = self.df_cargeivers["ID Intervenant"].to_list()
-
-        case_comb = []
-        for (case1, case2) in product(cases, cases):
-            if (
-                self.df_sessions.loc[
-                    self.df_sessions["idx"] == case1, "ID Client"
-                ].iloc[0]
-                in cargivers
-            ) & (
-                self.df_sessions.loc[
-                    self.df_sessions["idx"] == case2, "ID Client"
-                ].iloc[0]
-                in cargivers
-            ):
-
-                if (
-                    self.df_sessions.loc[
-                        self.df_sessions["idx"] == case1, "ID Client"
-                    ].iloc[0]
-                    != self.df_sessions.loc[
-                        self.df_sessions["idx"] == case2, "ID Client"
-                    ].iloc[0]
-                ):
-                    continue
-
-            if case1 <= case2:
-                case_comb.append((case1, case2))
-
-        return case_comb
+        # dummy sessions of different caregivers are never combined
+        different_caregivers = (
+            self.CAREGIVER_CASE_MASK[:, None]
+            & self.CAREGIVER_CASE_MASK[None, :]
+            & (self.CASE_CLIENTS[:, None] != self.CASE_CLIENTS[None, :])
+        )
+        mask = ~different_caregivers & (
+            self.CASE_IDS[:, None] <= self.CASE_IDS[None, :]
+        )
+        case1, case2 = np.nonzero(mask)
+        return list(
+            zip(self.CASE_IDS[case1].tolist(), self.CASE_IDS[case2].tolist())
+        )
 
     def create_model(self) -> pe.ConcreteModel:
         """Generate concrete model for optimisation problem."""
+        self.timer.lap()
         model = pe.ConcreteModel()
 
         # List of case IDs in schedule
@@ -377,6 +432,9 @@ class CareScheduler:
             initialize=self._generate_disjunctions(), dimen=3
         )
 
+        # Outgoing and incoming case connections per case and caregiver
+        self._build_arc_indexes(model.DISJUNCTIONS)
+
         # List of tasks - all possible (caseID, caregiverID) combination
         model.TASKS = pe.Set(initialize=self._generate_tasks(), dimen=2)
 
@@ -386,6 +444,8 @@ class CareScheduler:
             dimen=2,
         )
 
+        self.timer.lap("sets")
+
         # The duration (expected case time) for each operation
         model.CASE_DURATION = pe.Param(
             model.CASES, initialize=self._generate_case_durations()
@@ -411,17 +471,24 @@ class CareScheduler:
         # List of car commute times, bicycle commute times and commute meters
         model.COMMUTE = pe.Param(
             model.CLIENT_CONNECTIONS,
-            initialize=self._generate_clients_commute(),
+            initialize=self.CLIENTS_COMMUTE,
         )
         model.COMMUTE_BICYCLING = pe.Param(
             model.CLIENT_CONNECTIONS,
-            initialize=self._generate_clients_commute_bicycling(),
+            initialize=self.CLIENTS_COMMUTE_BICYCLING,
         )
         model.COMMUTE_CAR_METER = pe.Param(
             model.CLIENT_CONNECTIONS,
-            initialize=self._generate_commute_car_meters(),
+            initialize=self.COMMUTE_CAR_METERS,
         )
 
+        # Transport mode of caregivers, True if driving
+        caregiver_drives = dict(
+            zip(self.CAREGIVER_IDS.tolist(), self.CAREGIVER_DRIVES.tolist())
+        )
+
+        self.timer.lap("params")
+
         # Helper variables
         ub = 1440  # minutes in a day
         model.M = pe.Param(initialize=1e3 * ub)  # big M
@@ -460,108 +527,77 @@ class CareScheduler:
             rule=objective_function, sense=pe.minimize
         )
 
+        self.timer.lap("variables")
+
         # Constraints
         # each case can be maximum given once as source
         # for all destinations and caregivers
         def session_assignment(model: pe.ConcreteModel, case: int):
-            return (
-                sum(
-                    [
-                        model.SESSION_ASSIGNED[(case, case2, caregiver)]
-                        for case1, case2, caregiver in model.DISJUNCTIONS
-                        if case == case1
-                    ]
-                )
-                <= 1
-            )
+            source = [
+                model.SESSION_ASSIGNED[arc] for arc in self.ARCS_FROM[case]
+            ]
+            if not source:
+                return pe.Constraint.Skip
+            return sum(source) <= 1
 
         # each case can be maximum given once as destination for all sources and caregivers
         def session_assignment_2(model: pe.ConcreteModel, case: int):
-            return (
-                sum(
-                    [
-                        model.SESSION_ASSIGNED[(case1, case, caregiver)]
-                        for case1, case2, caregiver in model.DISJUNCTIONS
-                        if (case == case2) & (case1 <= case2)
-                    ]
-                )
-                <= 1
-            )
+            destination = [
+                model.SESSION_ASSIGNED[arc] for arc in self.ARCS_TO[case]
+            ]
+            if not destination:
+                return pe.Constraint.Skip
+            return sum(destination) <= 1
 
         # each case needs to be given at least once as source or destination
         def session_assignment_3(model: pe.ConcreteModel, case: int):
-            return (
-                sum(
-                    [
-                        model.SESSION_ASSIGNED[(case, case2, caregiver)]
-                        for case1, case2, caregiver in model.DISJUNCTIONS
-                        if case == case1
-                    ]
-                )
-                + sum(
-                    [
-                        model.SESSION_ASSIGNED[(case1, case, caregiver)]
-                        for case1, case2, caregiver in model.DISJUNCTIONS
-                        if (case == case2) & (case1 <= case2)
-                    ]
-                )
-                >= 1
-            )
+            source_or_destination = [
+                model.SESSION_ASSIGNED[arc]
+                for arc in self.ARCS_FROM[case] + self.ARCS_TO[case]
+            ]
+            # no caregiver can reach the case in time
+            if not source_or_destination:
+                return pe.Constraint.Infeasible
+            return sum(source_or_destination) >= 1
 
         # if a case is assigned to a caregiver as source, it can't be assigned to a different caregiver as destination
         def session_assignment_4(
             model: pe.ConcreteModel, case: int, caregiver_: int
         ):
-            return (
-                sum(
-                    [
-                        model.SESSION_ASSIGNED[(case1, case2, caregiver)]
-                        for case1, case2, caregiver in model.DISJUNCTIONS
-                        if (case == case1) & (caregiver_ == caregiver)
-                    ]
-                )
-                + sum(
-                    [
-                        model.SESSION_ASSIGNED[(case1, case2, caregiver)]
-                        for case1, case2, caregiver in model.DISJUNCTIONS
-                        if (case == case2)
-                        & (case1 <= case2)
-                        & (caregiver_ != caregiver)
-                    ]
-                )
-                <= 1
-            )
+            assigned = [
+                model.SESSION_ASSIGNED[arc]
+                for arc in self.ARCS_FROM_CAREGIVER[(case, caregiver_)]
+            ] + [
+                model.SESSION_ASSIGNED[arc]
+                for arc in self.ARCS_TO[case]
+                if arc[2] != caregiver_
+            ]
+            if not assigned:
+                return pe.Constraint.Skip
+            return sum(assigned) <= 1
 
         # if a case is assigned to a caregiver as destination, it also needs to be assigned as a source for this caregiver
         def session_assignment_6(
             model: pe.ConcreteModel, case: int, caregiver_: int
         ):
-            return (
-                (
-                    sum(
-                        [
-                            model.SESSION_ASSIGNED[(case1, case2, caregiver)]
-                            for case1, case2, caregiver in model.DISJUNCTIONS
-                            if (case == case1) & (caregiver_ == caregiver)
-                            | (model.IDX_CLIENTS[case1] == caregiver)
-                            & (caregiver_ == caregiver)
-                        ]
-                    )
-                    - sum(
-                        [
-                            model.SESSION_ASSIGNED[(case1, case2, caregiver)]
-                            for case1, case2, caregiver in model.DISJUNCTIONS
-                            if (
-                                (case == case2) & (caregiver_ == caregiver)
-                                | (model.IDX_CLIENTS[case2] == caregiver)
-                                & (caregiver_ == caregiver)
-                            )
-                            & (case1 <= case2)
-                        ]
-                    )
+            # connections starting or ending at the caregiver's dummy sessions
+            # already contain the case if it is one of them
+            source = self.ARCS_FROM_HOME[caregiver_]
+            destination = self.ARCS_TO_HOME[caregiver_]
+            if model.IDX_CLIENTS[case] != caregiver_:
+                source = self.ARCS_FROM_CAREGIVER[(case, caregiver_)] + source
+                destination = (
+                    self.ARCS_TO_CAREGIVER[(case, caregiver_)] + destination
                 )
-            ) == 0
+            if not source and not destination:
+                return pe.Constraint.Skip
+            return (
+                sum(model.SESSION_ASSIGNED[arc] for arc in source)
+                - sum(model.SESSION_ASSIGNED[arc] for arc in destination)
+                == 0
+            )
 
+        start_time = time.perf_counter()
         model.SESSION_ASSIGNMENT = pe.Constraint(
             model.CASES, rule=session_assignment
         )
@@ -577,15 +613,16 @@ class CareScheduler:
         model.SESSION_ASSIGNMENT_6 = pe.Constraint(
             model.TASKS, rule=session_assignment_6
         )
+        print(
+            "Built session assignment constraints in "
+            f"{time.perf_counter() - start_time:.2f}s"
+        )
 
         # define how downtime counts are calculated
         def down_time_counts(
             model: pe.ConcreteModel, case1: int, case2: int, caregiver: int
         ):
-            if self.df_caregiver_transport.loc[
-                self.df_caregiver_transport["ID Intervenant"] == caregiver,
-                "Permis",
-            ].iloc[0]:
+            if caregiver_drives[caregiver]:
                 commute_expr = model.SESSION_ASSIGNED[
                     case1, case2, caregiver
                 ] * int(
@@ -636,10 +673,7 @@ class CareScheduler:
         def commute_care(
             model: pe.ConcreteModel, case1: int, case2: int, caregiver: int
         ):
-            if self.df_caregiver_transport.loc[
-                self.df_caregiver_transport["ID Intervenant"] == caregiver,
-                "Permis",
-            ].iloc[0]:
+            if caregiver_drives[caregiver]:
                 commute_expr = model.SESSION_ASSIGNED[
                     case1, case2, caregiver
                 ] * (
@@ -671,10 +705,7 @@ class CareScheduler:
         def commute_meters(
             model: pe.ConcreteModel, case1: int, case2: int, caregiver: int
         ):
-            if self.df_caregiver_transport.loc[
-                self.df_caregiver_transport["ID Intervenant"] == caregiver,
-                "Permis",
-            ].iloc[0]:
+            if caregiver_drives[caregiver]:
                 commute_expr = model.SESSION_ASSIGNED[
                     case1, case2, caregiver
                 ] * (
@@ -697,15 +728,19 @@ class CareScheduler:
             model.DISJUNCTIONS, rule=commute_meters
         )
 
+        self.timer.lap("constraints")
+
+        if self.formulation == "linear":
+            self._fix_overlapping_arcs(model)
+            self.timer.lap("fix_overlapping_arcs")
+            return model
+
         # Disjunction
         # define that two case combinations cannot overlap for a caregiver
         def no_case_overlap(
             model: pe.ConcreteModel, case1: int, case2: int, caregiver: int
         ):
-            if self.df_caregiver_transport.loc[
-                self.df_caregiver_transport["ID Intervenant"] == caregiver,
-                "Permis",
-            ].iloc[0]:
+            if caregiver_drives[caregiver]:
                 return [
                     model.CASE_START_TIME[case1]
                     + model.CASE_DURATION[case1]
@@ -756,65 +791,429 @@ class CareScheduler:
             model.DISJUNCTIONS, rule=no_case_overlap
         )
 
+        self.timer.lap("disjunctions")
         pe.TransformationFactory("gdp.bigm").apply_to(model)
+        self.timer.lap("bigm_transform")
 
         return model
 
-    def solve(self, time_limit: int = 1200):
-        solvername = "cbc"
-        solverpath_exe = "/opt/homebrew/bin/cbc"
-        solver = pe.SolverFactory(solvername, executable=solverpath_exe)
+    def _home_sessions(self) -> tuple[dict, dict]:
+        """Get first and last dummy session of every caregiver position."""
+        case_end = self.START_TIMES + self.DURATIONS
+        order = np.lexsort((case_end, self.START_TIMES))
+        caregiver_position = {
+            caregiver: pos
+            for pos, caregiver in enumerate(self.CAREGIVER_IDS.tolist())
+        }
+        home_start, home_end = {}, {}
+        for case in order[self.CAREGIVER_CASE_MASK[order]]:
+            caregiver = caregiver_position[self.CASE_CLIENTS[case]]
+            home_start.setdefault(caregiver, int(case))
+            home_end[caregiver] = int(case)
+        return home_start, home_end
+
+    def _greedy_routes(self, keep_given: bool = True) -> dict:
+        """Construct a route of cases for every caregiver.
+
+        Cases are appended in start time order to the route of their given
+        caregiver if the connection fits in time, otherwise to the route of the
+        caregiver with the shortest commute to the case. Every route starts and
+        ends at the caregiver's dummy sessions.
+
+        Parameters:
+            keep_given (bool, optional): Prefer the given caregiver of a case.
+                Defaults to True.
+
+        Returns:
+            dict: Case positions of every caregiver position's route in
+                visiting order, None if a case fits into no route.
+        """
+        case_end = self.START_TIMES + self.DURATIONS
+        given = np.full(len(self.CASE_IDS), np.nan)
+        if keep_given and "Given_Caregiver_ID" in self.df_sessions:
+            given = self.df_sessions["Given_Caregiver_ID"].to_numpy()
+        caregiver_commute = [
+            self.CASE_COMMUTE if drives else self.CASE_COMMUTE_BICYCLING
+            for drives in self.CAREGIVER_DRIVES
+        ]
 
-        # Add solver parameters (time limit)
-        options = {"seconds": time_limit}
-        for key, value in options.items():
-            solver.options[key] = value
+        # all cases of a route are possible for the caregiver, so only the
+        # time of the connection needs to be checked
+        def fits(caregiver: int, case1: int, case2: int) -> bool:
+            commute = caregiver_commute[caregiver][case1, case2]
+            return case_end[case1] + commute <= self.START_TIMES[case2]
+
+        order = np.lexsort((case_end, self.START_TIMES))
+        home_start, home_end = self._home_sessions()
+        routes = {caregiver: [case] for caregiver, case in home_start.items()}
+
+        self.n_given_kept = 0
+        for case in order[~self.CAREGIVER_CASE_MASK[order]]:
+            candidates = [
+                caregiver
+                for caregiver, route in routes.items()
+                if self.TASK_MASK[case, caregiver]
+                and fits(caregiver, route[-1], case)
+                and fits(caregiver, case, home_end[caregiver])
+            ]
+            if not candidates:
+                return None
+            given_candidates = [
+                caregiver
+                for caregiver in candidates
+                if self.CAREGIVER_IDS[caregiver] == given[case]
+            ]
+            if given_candidates:
+                caregiver = given_candidates[0]
+                self.n_given_kept += 1
+            else:
+                caregiver = min(
+                    candidates,
+                    key=lambda caregiver: caregiver_commute[caregiver][
+                        routes[caregiver][-1], case
+                    ],
+                )
+            routes[caregiver].append(case)
+
+        for caregiver, route in routes.items():
+            if home_end[caregiver] != route[0]:
+                route.append(home_end[caregiver])
+        if keep_given:
+            print(
+                f"Greedy routes keep the given caregiver of "
+                f"{self.n_given_kept} of {(~self.CAREGIVER_CASE_MASK).sum()} "
+                "sessions"
+            )
+        return {
+            caregiver: [int(case) for case in route]
+            for caregiver, route in routes.items()
+        }
+
+    def warm_start(self) -> bool:
+        """Set the model variables to a constructed schedule as MIP start.
+
+        The schedule keeps the given caregiver assignment where it is feasible
+        under availability, competence and commute times and fills the rest
+        with the greedy routes of _greedy_routes. With the bigm formulation,
+        the disjunct indicators of every arc are set to the time order of its
+        cases, so that the start is complete.
+
+        Returns:
+            bool: Whether every case could be assigned.
+        """
+        routes = self._greedy_routes()
+        if routes is None:
+            print("No warm start: some cases fit into no caregiver's route")
+            return False
+
+        # first case of every assigned arc in its route
+        assigned = {}
+        caregiver_ids = self.CAREGIVER_IDS.tolist()
+        for caregiver, route in routes.items():
+            caregiver = caregiver_ids[caregiver]
+            route = self.CASE_IDS[route].tolist()
+            for case1, case2 in zip(route[:-1], route[1:]):
+                arc = (min(case1, case2), max(case1, case2), caregiver)
+                assigned[arc] = case1
+
+        model = self.model
+        caregiver_drives = dict(
+            zip(self.CAREGIVER_IDS.tolist(), self.CAREGIVER_DRIVES.tolist())
+        )
+        for arc in model.DISJUNCTIONS:
+            case1, case2, caregiver = arc
+            clients = (model.IDX_CLIENTS[case1], model.IDX_CLIENTS[case2])
+            # keep connections frozen by reoptimise
+            var = model.SESSION_ASSIGNED[arc]
+            value = int(var.value) if var.fixed else int(arc in assigned)
+            if caregiver_drives[caregiver]:
+                commute = self.CLIENTS_COMMUTE[clients]
+                meters = self.COMMUTE_CAR_METERS[clients]
+            else:
+                commute = self.CLIENTS_COMMUTE_BICYCLING[clients]
+                meters = 0
+            down_time = (
+                model.CASE_START_TIME[case2]
+                - (
+                    model.CASE_START_TIME[case1]
+                    + model.CASE_DURATION[case1]
+                    + commute
+                )
+                < 30
+            )
 
-        # Solve model (verbose)
-        solver_results = solver.solve(self.model, tee=True)
-        return solver_results
+            # zero is at the open bound of the positive commute variables
+            model.SESSION_ASSIGNED[arc].set_value(value)
+            model.DOWN_TIME_COUNTS[arc].set_value(value * int(down_time))
+            model.COMMUTE_CARE[arc].set_value(
+                value * commute, skip_validation=True
+            )
+            model.COMMUTE_METERS[arc].set_value(
+                value * meters, skip_validation=True
+            )
 
+            if self.formulation == "bigm":
+                # the first disjunct orders case1 before case2
+                if arc in assigned:
+                    case1_first = assigned[arc] == case1
+                else:
+                    case1_first = (
+                        model.CASE_START_TIME[case1]
+                        <= model.CASE_START_TIME[case2]
+                    )
+                disjuncts = model.DISJUNCTIONS_RULE[arc].disjuncts
+                disjuncts[0].binary_indicator_var.set_value(int(case1_first))
+                disjuncts[1].binary_indicator_var.set_value(
+                    int(not case1_first)
+                )
+        return True
 
-def main(
-    include_availability: bool = True,
-    filter_for_competence: bool = True,
-    transport: str = "license",
-    carbon_reduction: bool = False,
-    time_limit: int = 1200,
-    one_date: bool = False,
-    day: str = None,
-    saved_file_name: str = None,
-) -> None:
-    commute_data_df = get_commute_data()
-    caregivers = caregivers = pd.read_excel(
-        "data/ChallengeXHEC23022024.xlsx", sheet_name=2
-    )
-    # iterate over all days of january
-    for i in range(1, 32):
-        if i < 10:
-            i = f"0{i}"
-        else:
-            i = str(i)
+    def solve(
+        self,
+        time_limit: int = 1200,
+        backend: str = "cbc",
+        executable: str = None,
+        threads: int = None,
+        mip_gap: float = None,
+        tee: bool = False,
+        warmstart: bool = False,
+    ) -> SolveStats:
+        """Solve the model, reusing the solver for repeated solves.
+
+        With warmstart, the model is seeded with the schedule of warm_start.
+        The heuristic engine only uses the time limit, the route engine solves
+        its master problems with the configured solver.
+        """
+        if self.reoptimised_caregivers is not None:
+            raise RuntimeError(
+                "The model describes the sessions before reoptimise, "
+                "build a new CareScheduler to solve the changed day"
+            )
+        self.incumbent = None
+        if self.engine == "heuristic":
+            return self._solve_heuristic(time_limit)
+
+        settings = (backend, executable, threads, mip_gap, time_limit, tee)
+        if getattr(self, "solver_settings", None) != settings:
+            self.solver = ModelSolver(
+                backend=backend,
+                executable=executable,
+                threads=threads,
+                mip_gap=mip_gap,
+                time_limit=time_limit,
+                tee=tee,
+            )
+            self.solver_settings = settings
+        if self.engine == "routes":
+            return self._solve_routes(time_limit)
+        if warmstart:
+            warmstart = self.warm_start()
+        return self.solver.solve(self.model, warmstart=warmstart)
+
+    def _solve_heuristic(self, time_limit: int = 1200) -> SolveStats:
+        """Build greedy routes and improve them by local search."""
+        start_time = time.perf_counter()
+        self.routes = {}
+        routes = self._greedy_routes(keep_given=False)
+        if routes is None:
+            return SolveStats(
+                backend="heuristic",
+                termination_condition="infeasible",
+                objective=None,
+                bound=None,
+                gap=None,
+                nodes=None,
+                wall_time=time.perf_counter() - start_time,
+            )
 
-        if one_date:
-            i = day
+        search = self._local_search(routes)
+        termination = search.run(
+            time_limit - (time.perf_counter() - start_time)
+        )
+        self.routes = search.routes
+        return SolveStats(
+            backend="heuristic",
+            termination_condition=termination,
+            objective=search.objective,
+            bound=None,
+            gap=None,
+            nodes=None,
+            wall_time=time.perf_counter() - start_time,
+        )
 
-        print(f"Starting optimisation for 2024-01-{i}")
-        scheduler = CareScheduler(
-            date=f"2024-01-{i}",
-            include_availability=include_availability,
-            transport=transport,
-            filter_for_competence=filter_for_competence,
-            carbon_reduction=carbon_reduction,
+    def _solve_routes(self, time_limit: int = 1200) -> SolveStats:
+        """Generate routes by column generation and select one per caregiver.
+
+        The greedy routes, if they exist, are the initial columns.
+        """
+        start_time = time.perf_counter()
+        home_start, home_end = self._home_sessions()
+        routes = self._greedy_routes(keep_given=False) or {}
+        generation = RouteGeneration(
+            self._local_search(routes), home_start, home_end, self.solver
+        )
+        self.routes = generation.run(time_limit)
+        n_uncovered = sum(
+            (generation.master.UNCOVERED[session].value or 0) > 0.5
+            for session in generation.sessions
         )
-        _ = scheduler.solve(time_limit)
-        model = scheduler.model
+        if n_uncovered:
+            print(f"{n_uncovered} sessions are covered by no selected route")
+        return generation.solve_stats(time.perf_counter() - start_time)
+
+    def _local_search(self, routes: dict) -> LocalSearch:
+        """Set up the local search on routes of caregiver positions."""
+        return LocalSearch(
+            self.START_TIMES,
+            self.DURATIONS,
+            self.CASE_COMMUTE,
+            self.CASE_COMMUTE_BICYCLING,
+            self.CAREGIVER_DRIVES,
+            self.TASK_MASK,
+            routes,
+            commute_meters=(
+                self.CASE_COMMUTE_METERS if self.carbon_reduction else None
+            ),
+        )
+
+    def clusters(self, n_clusters: int, seed: int = 0) -> list[tuple]:
+        """Split caregivers and clients into geographic clusters.
+
+        Caregivers are clustered by the location of their homes with k-means
+        and every client joins the cluster with the nearest center.
+
+        Parameters:
+            n_clusters (int): Number of clusters, at most one per caregiver.
+            seed (int, optional): Random state of k-means. Defaults to 0.
+
+        Returns:
+            list[tuple]: Caregiver IDs and client IDs of every cluster.
+        """
+        caregiver_locations = self.df_cargeivers[["Latitude", "Longitude"]]
+        client_ids = self.df_sessions.loc[
+            ~self.df_sessions["ID Client"].isin(self.CAREGIVER_IDS),
+            "ID Client",
+        ].unique()
+        client_locations = (
+            self.data.clients.set_index("ID Client")
+            .loc[client_ids, ["Latitude", "Longitude"]]
+            .to_numpy()
+        )
+
+        kmeans = KMeans(
+            n_clusters=min(n_clusters, len(self.CAREGIVER_IDS)),
+            n_init=10,
+            random_state=seed,
+        ).fit(caregiver_locations.to_numpy())
+        client_labels = kmeans.predict(client_locations)
+        return [
+            (
+                self.CAREGIVER_IDS[kmeans.labels_ == label].tolist(),
+                client_ids[client_labels == label].tolist(),
+            )
+            for label in range(kmeans.n_clusters)
+        ]
 
-        # get all session assigned by key
+    def repair(
+        self, assignments: pd.DataFrame, time_limit: int = 1200
+    ) -> SolveStats:
+        """Merge the assignments of all clusters and repair them.
+
+        Routes that don't fit in time and sessions without a caregiver are
+        inserted where they increase the objective least. Relocate and swap
+        moves across all caregivers then improve sessions at cluster borders.
+
+        Parameters:
+            assignments (pd.DataFrame): Caregiver_ID of every idx as from
+                CareScheduler.assignments of the clusters.
+            time_limit (int, optional): Time limit in seconds. Defaults to 1200.
+
+        Returns:
+            SolveStats: Termination and objective of the repaired routes.
+        """
+        start_time = time.perf_counter()
+        home_start, home_end = self._home_sessions()
+        case_position = pd.Series(
+            np.arange(len(self.CASE_IDS)), index=self.CASE_IDS
+        )
+        caregiver_position = pd.Series(
+            np.arange(len(self.CAREGIVER_IDS)), index=self.CAREGIVER_IDS
+        )
+        assignments = assignments[
+            assignments["idx"].isin(self.CASE_IDS)
+            & assignments["Caregiver_ID"].isin(self.CAREGIVER_IDS)
+        ].drop_duplicates("idx")
+        assigned = defaultdict(list)
+        for case, caregiver in zip(
+            case_position[assignments["idx"]].tolist(),
+            caregiver_position[assignments["Caregiver_ID"]].tolist(),
+        ):
+            if not self.CAREGIVER_CASE_MASK[case]:
+                assigned[caregiver].append(case)
+
+        search = self._local_search(
+            {
+                caregiver: [home_start[caregiver], home_end[caregiver]]
+                for caregiver in home_start
+            }
+        )
+        # sessions of routes that don't fit or of no route are unassigned
+        unassigned = set(np.flatnonzero(~self.CAREGIVER_CASE_MASK).tolist())
+        for caregiver, route in search.routes.items():
+            new_route = sorted(
+                route + assigned[caregiver], key=search.rank.__getitem__
+            )
+            cost = search.route_cost(caregiver, new_route)
+            if not np.isinf(cost):
+                search.routes[caregiver] = new_route
+                search.costs[caregiver] = cost
+                unassigned -= set(assigned[caregiver])
+        unassigned = sorted(unassigned, key=search.rank.__getitem__)
+
+        n_unassigned = len(unassigned)
+        unassigned = [case for case in unassigned if not search.insert(case)]
+        print(
+            f"Repair inserted {n_unassigned - len(unassigned)} of "
+            f"{n_unassigned} sessions without a feasible cluster route"
+        )
+        termination = search.run(
+            time_limit - (time.perf_counter() - start_time)
+        )
+        self.routes = search.routes
+        if unassigned:
+            print(f"{len(unassigned)} sessions fit into no caregiver's route")
+            termination = "infeasible"
+        return SolveStats(
+            backend="repair",
+            termination_condition=termination,
+            objective=search.objective,
+            bound=None,
+            gap=None,
+            nodes=None,
+            wall_time=time.perf_counter() - start_time,
+        )
+
+    def assignments(self) -> pd.DataFrame:
+        """Get the caregiver assigned to every case of the solution."""
+        if self.incumbent is not None:
+            return self.incumbent
+        if self.model is None:
+            cases, caregivers = [], []
+            for caregiver, route in self.routes.items():
+                cases += route
+                caregivers += [caregiver] * len(route)
+            return pd.DataFrame(
+                {
+                    "idx": self.CASE_IDS[cases],
+                    "Caregiver_ID": self.CAREGIVER_IDS[caregivers],
+                }
+            )
+
+        # get all session assigned by key (robust to solver tolerances)
         actions = [
             k
-            for k, v in model.SESSION_ASSIGNED.extract_values().items()
-            if v == 1
+            for k, v in self.model.SESSION_ASSIGNED.extract_values().items()
+            if v is not None and v > 0.5
         ]
         actions_df = pd.DataFrame(
             actions, columns=["idx1", "idx2", "Caregiver_ID"]
@@ -824,26 +1223,369 @@ def main(
         actions_df_1.columns = ["idx", "Caregiver_ID"]
         actions_df_2.columns = ["idx", "Caregiver_ID"]
         actions_df = pd.concat([actions_df_1, actions_df_2], axis=0)
-        actions_df = actions_df.drop_duplicates()
+        return actions_df.drop_duplicates()
+
+    def reoptimise(
+        self,
+        now: int,
+        add_sessions: pd.DataFrame = None,
+        remove_sessions: list = (),
+        add_caregivers: list = (),
+        remove_caregivers: list = (),
+        neighbourhood: int = 3,
+        **solver_kwargs,
+    ) -> SolveStats:
+        """Re-optimise the solved day after intraday changes.
+
+        Sessions that started before now keep their caregiver. Only the
+        caregivers affected by the changes are solved again as a smaller model:
+        added caregivers, caregivers of removed sessions and the caregivers
+        living closest to every session that lost its caregiver or was added.
+        Their current assignment is the warm start, the routes of all other
+        caregivers stay as they are. The merged assignment is returned by
+        CareScheduler.assignments, the sessions keep their given caregiver.
+        The model of the day is not rebuilt, so solve raises after a
+        reoptimise, while further reoptimise calls build on the merged one.
+
+        Parameters:
+            now (int): Minutes since midnight.
+            add_sessions (pd.DataFrame, optional): New sessions with the columns
+                of the schedule except idx. Defaults to None.
+            remove_sessions (list, optional): idx of cancelled sessions.
+                Defaults to ().
+            add_caregivers (list, optional): IDs of caregivers joining the day.
+                Defaults to ().
+            remove_caregivers (list, optional): IDs of caregivers leaving the
+                day. Defaults to ().
+            neighbourhood (int, optional): Number of closest caregivers that
+                may take over a session without caregiver. Defaults to 3.
+            **solver_kwargs: Keyword arguments of CareScheduler.solve.
+
+        Returns:
+            SolveStats: Statistics of the solve of the affected caregivers.
+        """
+        incumbent = self.assignments()
+        caregiver_of = dict(zip(incumbent["idx"], incumbent["Caregiver_ID"]))
+        if self.reoptimised_caregivers is not None:
+            day_caregivers = self.reoptimised_caregivers
+        else:
+            day_caregivers = self.CAREGIVER_IDS.tolist()
+        caregivers = [
+            caregiver
+            for caregiver in day_caregivers
+            if caregiver not in remove_caregivers
+        ] + list(add_caregivers)
+
+        # dummy sessions of joining caregivers and new sessions
+        day_sessions = self.data.sessions_for(self.date)
+        new_sessions = [
+            day_sessions[day_sessions["ID Client"].isin(add_caregivers)]
+        ]
+        if add_sessions is not None:
+            first_idx = max(
+                self.data.max_session_idx(), self.df_sessions["idx"].max()
+            )
+            new_sessions.append(
+                add_sessions.assign(
+                    Date=self.date,
+                    idx=np.arange(len(add_sessions)) + first_idx + 1,
+                )
+            )
+        sessions = pd.concat(
+            [self.df_sessions] + new_sessions, ignore_index=True
+        )
+        # current caregiver of every session, the given one stays as it is
+        current = sessions["idx"].map(caregiver_of)
+        frozen = sessions["Start_time"] <= now
+        is_dummy = sessions["ID Client"].isin(
+            self.data.caregivers["ID Intervenant"]
+        )
+        sessions = sessions[
+            ~sessions["idx"].isin(remove_sessions)
+            & ~(
+                is_dummy
+                & ~frozen
+                & sessions["ID Client"].isin(remove_caregivers)
+            )
+        ]
+        frozen = frozen.loc[sessions.index]
+        is_dummy = is_dummy.loc[sessions.index]
+        current = current.loc[sessions.index]
+        orphaned = ~frozen & ~is_dummy & ~current.isin(caregivers)
+
+        # caregivers living closest to the sessions without caregiver
+        caregiver_positions = self.data.commute_positions(caregivers)
+        affected = set(add_caregivers) | set(
+            incumbent.loc[
+                incumbent["idx"].isin(remove_sessions), "Caregiver_ID"
+            ]
+        )
+        for client in sessions.loc[orphaned, "ID Client"].unique():
+            commute = self.data.commute["driving_seconds"][
+                caregiver_positions,
+                self.data.commute_positions([client])[0],
+            ]
+            affected |= {
+                caregivers[pos]
+                for pos in np.argsort(commute)[:neighbourhood].tolist()
+            }
+        affected = [
+            caregiver for caregiver in caregivers if caregiver in affected
+        ]
+        untouched = [
+            caregiver for caregiver in caregivers if caregiver not in affected
+        ]
+
+        # untouched routes and started sessions of leaving caregivers stay
+        keep = (frozen & ~current.isin(affected)) | current.isin(untouched)
+        kept = pd.DataFrame(
+            {"idx": sessions.loc[keep, "idx"], "Caregiver_ID": current[keep]}
+        )
+        self.df_sessions = sessions
+        self.reoptimised_caregivers = caregivers
+        if not affected:
+            self.incumbent = kept
+            return SolveStats(
+                backend="incumbent",
+                termination_condition="unchanged",
+                objective=None,
+                bound=None,
+                gap=None,
+                nodes=None,
+                wall_time=0.0,
+            )
+
+        # solve the affected caregivers on their own sessions, warm started
+        # from their current assignment
+        data = copy.copy(self.data)
+        data.sessions = sessions[~keep].assign(
+            Given_Caregiver_ID=current[~keep]
+        )
+        scheduler = CareScheduler(
+            date=self.date,
+            transport=self.data.transport,
+            filter_for_competence=self.filter_for_competence,
+            carbon_reduction=self.carbon_reduction,
+            prune_arcs=self.prune_arcs,
+            formulation=self.formulation,
+            data=data,
+            caregiver_ids=affected,
+        )
+        scheduler._freeze(now)
+        solve_stats = scheduler.solve(**{"warmstart": True, **solver_kwargs})
+        self.incumbent = pd.concat(
+            [kept, scheduler.assignments()], ignore_index=True
+        )
+        return solve_stats
+
+    def _freeze(self, now: int) -> None:
+        """Fix the connections between sessions that started before now.
+
+        Frozen connections keep the value of the given caregivers' routes.
+        """
+        case_end = self.START_TIMES + self.DURATIONS
+        order = np.lexsort((case_end, self.START_TIMES))
+        given = self.df_sessions["Given_Caregiver_ID"].to_numpy()[order]
+        case_ids = self.CASE_IDS[order].tolist()
+
+        # connections of consecutive sessions in the given routes
+        given_arcs = set()
+        for caregiver in self.CAREGIVER_IDS.tolist():
+            route = [
+                case
+                for case, client, given_caregiver in zip(
+                    case_ids, self.CASE_CLIENTS[order].tolist(), given
+                )
+                if given_caregiver == caregiver or client == caregiver
+            ]
+            for case1, case2 in zip(route[:-1], route[1:]):
+                given_arcs.add(
+                    (min(case1, case2), max(case1, case2), caregiver)
+                )
+
+        frozen = set(self.CASE_IDS[self.START_TIMES <= now].tolist())
+        for arc in self.model.DISJUNCTIONS:
+            case1, case2, _ = arc
+            if case1 in frozen and case2 in frozen:
+                self.model.SESSION_ASSIGNED[arc].fix(int(arc in given_arcs))
+
+
+# scheduler data of worker processes, attached by _init_worker
+_WORKER_DATA = None
+
+
+def _init_worker(handle: dict) -> None:
+    """Attach a worker process to the scheduler data in shared memory."""
+    global _WORKER_DATA
+    _WORKER_DATA = SchedulerData.attach(handle)
+
+
+def solve_cluster(
+    date: str,
+    caregiver_ids: list,
+    client_ids: list,
+    scheduler_kwargs: dict,
+    solver_kwargs: dict,
+    data: SchedulerData = None,
+) -> pd.DataFrame:
+    """Optimise the schedule of one cluster of caregivers and clients.
+
+    Returns:
+        pd.DataFrame: Caregiver_ID of every assigned idx, empty if the cluster
+            model can't be built.
+    """
+    if data is None:
+        data = _WORKER_DATA
+    try:
+        scheduler = CareScheduler(
+            date=date,
+            data=data,
+            caregiver_ids=caregiver_ids,
+            client_ids=client_ids,
+            **scheduler_kwargs,
+        )
+    except ValueError as error:
+        # e.g. a session that no caregiver of the cluster can reach in time
+        print(f"Skipping cluster of {len(caregiver_ids)} caregivers: {error}")
+        return pd.DataFrame(columns=["idx", "Caregiver_ID"])
+    solve_stats = scheduler.solve(**solver_kwargs)
+    print(
+        f"Finished cluster of {len(caregiver_ids)} caregivers and "
+        f"{len(client_ids)} clients: {solve_stats}"
+    )
+    return scheduler.assignments()
+
+
+def solve_clusters(
+    date: str,
+    data: SchedulerData,
+    scheduler_kwargs: dict,
+    solver_kwargs: dict,
+    n_clusters: int,
+    executor: ProcessPoolExecutor = None,
+) -> tuple[CareScheduler, SolveStats]:
+    """Optimise one day by geographic clusters and repair across them.
+
+    Parameters:
+        date (str): Date of the schedule, e.g. "2024-01-01".
+        data (SchedulerData): Loaded scheduler inputs.
+        scheduler_kwargs (dict): Keyword arguments of CareScheduler.
+        solver_kwargs (dict): Keyword arguments of CareScheduler.solve.
+        n_clusters (int): Number of clusters.
+        executor (ProcessPoolExecutor, optional): Pool of workers attached to
+            the shared data to solve the clusters in. Defaults to None.
+
+    Returns:
+        tuple[CareScheduler, SolveStats]: Scheduler of the whole day holding the
+            repaired routes and statistics of the repair.
+    """
+    # the whole day is only searched by the heuristic, without a model
+    scheduler = CareScheduler(
+        date=date, data=data, **{**scheduler_kwargs, "engine": "heuristic"}
+    )
+    clusters = [
+        (caregiver_ids, client_ids)
+        for caregiver_ids, client_ids in scheduler.clusters(n_clusters)
+        if client_ids
+    ]
+    args = [
+        (date, caregiver_ids, client_ids, scheduler_kwargs, solver_kwargs)
+        for caregiver_ids, client_ids in clusters
+    ]
+    if executor is None:
+        assignments = [solve_cluster(*arg, data=data) for arg in args]
+    else:
+        futures = [executor.submit(solve_cluster, *arg) for arg in args]
+        assignments = [future.result() for future in futures]
+
+    solve_stats = scheduler.repair(
+        pd.concat(
+            [pd.DataFrame(columns=["idx", "Caregiver_ID"])] + assignments
+        ),
+        time_limit=solver_kwargs["time_limit"],
+    )
+    return scheduler, solve_stats
+
+
+def optimise_day(
+    day: str,
+    commute_data_df: pd.DataFrame,
+    caregivers: pd.DataFrame,
+    scheduler_kwargs: dict,
+    solver_kwargs: dict,
+    saved_file_name: str = None,
+    data: SchedulerData = None,
+    clusters: int = 1,
+    executor: ProcessPoolExecutor = None,
+) -> None:
+    """Optimise the schedule of one day of january and save it with its plots.
+
+    Parameters:
+        day (str): Day of january, e.g. "01".
+        commute_data_df (pd.DataFrame): All commutes as from get_commute_data.
+        caregivers (pd.DataFrame): Caregivers sheet.
+        scheduler_kwargs (dict): Keyword arguments of CareScheduler.
+        solver_kwargs (dict): Keyword arguments of CareScheduler.solve.
+        saved_file_name (str, optional): File name of the results csv. Defaults to None.
+        data (SchedulerData, optional): Loaded scheduler inputs. Defaults to the
+            data shared with the worker process.
+        clusters (int, optional): Number of geographic clusters to solve
+            separately. Defaults to 1.
+        executor (ProcessPoolExecutor, optional): Pool to solve the clusters in.
+            Defaults to None.
+
+    Returns: None
+    """
+    transport = scheduler_kwargs["transport"]
+    if data is None:
+        data = _WORKER_DATA
+
+    print(f"Starting optimisation for 2024-01-{day}")
+    timer = PhaseTimer()
+    if clusters > 1:
+        with timer.phase("clusters"):
+            scheduler, solve_stats = solve_clusters(
+                f"2024-01-{day}",
+                data,
+                scheduler_kwargs,
+                solver_kwargs,
+                clusters,
+                executor=executor,
+            )
+    else:
+        with timer.phase("build"):
+            scheduler = CareScheduler(
+                date=f"2024-01-{day}", data=data, **scheduler_kwargs
+            )
+        with timer.phase("solve"):
+            solve_stats = scheduler.solve(**solver_kwargs)
+    print(f"Finished optimisation for 2024-01-{day}: {solve_stats}")
+    with timer.phase("result_extraction"):
+        actions_df = scheduler.assignments()
 
         # merge input schedule and assigned sessions
         temp = scheduler.df_sessions.copy()
         temp = temp.merge(actions_df, how="left", on="idx")
 
-        # save optimised schedule for the day as csv
-        results_dir = Path("results_new_client")
-        results_dir.mkdir(parents=True, exist_ok=True)
+    # save optimised schedule for the day as csv
+    results_dir = Path("results_new_client")
+    results_dir.mkdir(parents=True, exist_ok=True)
 
+    with timer.phase("save"):
         if not saved_file_name:
             temp.to_csv(
-                results_dir / f"optimised_Q1_2024-01-{i}.csv", index=False
+                results_dir / f"optimised_Q1_2024-01-{day}.csv", index=False
             )
         else:
             temp.to_csv(results_dir / f"{saved_file_name}.csv", index=False)
 
-        # Plot agenda and Save it
-        plots_dir = Path("plots")
-        jan24_df = preprocess_schedules(temp, caregivers, kind=transport)
+    # Plot agenda and Save it
+    jan24_df = preprocess_schedules(temp, caregivers, kind=transport)
+    with timer.phase("kpis"):
+        kpis = schedule_kpis(jan24_df, commute_data_df, kind=transport)
+
+    plots_dir = Path("plots")
+    with timer.phase("plotting"):
         for intervenant_id in jan24_df["ID Intervenant"].unique():
             plot_agenda(
                 intervenant_id,
@@ -851,10 +1593,134 @@ def main(
                 commute_data_df,
                 kind=transport,
                 save_plots=True,
-                save_dir=plots_dir / f"2024-01-{i}",
+                save_dir=plots_dir / f"2024-01-{day}",
+            )
+
+    # one line per day of where the time went and how large the model was
+    write_profile(
+        {
+            "date": f"2024-01-{day}",
+            "engine": scheduler.engine,
+            "clusters": clusters,
+            "data_load": data.load_time,
+            "phases": {**timer.phases, **scheduler.timer.phases},
+            "model": (
+                model_size(scheduler.model)
+                if scheduler.model is not None
+                else None
+            ),
+            "solver": solve_stats.to_dict(),
+            "kpis": kpis.to_dict(),
+        },
+        results_dir / "run_profile.jsonl",
+    )
+
+
+def main(
+    include_availability: bool = True,
+    filter_for_competence: bool = True,
+    transport: str = "license",
+    carbon_reduction: bool = False,
+    time_limit: int = 1200,
+    one_date: bool = False,
+    day: str = None,
+    saved_file_name: str = None,
+    prune_arcs: bool = True,
+    formulation: str = "bigm",
+    backend: str = "cbc",
+    executable: str = None,
+    threads: int = None,
+    mip_gap: float = None,
+    tee: bool = False,
+    workers: int = 1,
+    warmstart: bool = False,
+    engine: str = "mip",
+    clusters: int = 1,
+) -> None:
+    commute_data_df = get_commute_data()
+    data = SchedulerData.load(transport)
+    caregivers = data.caregivers.copy()
+    scheduler_kwargs = {
+        "include_availability": include_availability,
+        "transport": transport,
+        "filter_for_competence": filter_for_competence,
+        "carbon_reduction": carbon_reduction,
+        "prune_arcs": prune_arcs,
+        "formulation": formulation,
+        "engine": engine,
+    }
+    solver_kwargs = {
+        "time_limit": time_limit,
+        "backend": backend,
+        "executable": executable,
+        "threads": threads,
+        "mip_gap": mip_gap,
+        "tee": tee,
+        "warmstart": warmstart,
+    }
+
+    # iterate over all days of january
+    days = [day] if one_date else [f"{i:02d}" for i in range(1, 32)]
+    if workers <= 1:
+        for i in days:
+            optimise_day(
+                i,
+                commute_data_df,
+                caregivers,
+                scheduler_kwargs,
+                solver_kwargs,
+                saved_file_name,
+                data=data,
+                clusters=clusters,
             )
-        if one_date:
-            break
+        return
+
+    # cap solver threads so that parallel days don't oversubscribe the cores
+    threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    solver_kwargs["threads"] = min(
+        threads or threads_per_worker, threads_per_worker
+    )
+    # workers read the commute matrices from shared memory
+    handle = data.share()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(handle,)
+        ) as executor:
+            if clusters > 1:
+                # days one after another with their clusters in parallel
+                for i in days:
+                    optimise_day(
+                        i,
+                        commute_data_df,
+                        caregivers,
+                        scheduler_kwargs,
+                        solver_kwargs,
+                        saved_file_name,
+                        data=data,
+                        clusters=clusters,
+                        executor=executor,
+                    )
+                return
+
+            futures = {
+                executor.submit(
+                    optimise_day,
+                    i,
+                    commute_data_df,
+                    caregivers,
+                    scheduler_kwargs,
+                    solver_kwargs,
+                    saved_file_name,
+                ): i
+                for i in days
+            }
+            for future in as_completed(futures):
+                future.result()
+                print(
+                    f"Saved optimised schedule for 2024-01-{futures[future]}"
+                )
+    finally:
+        data.close()
 
 
 if __name__ == "__main__":
@@ -884,6 +1750,68 @@ if __name__ == "__main__":
     parser.add_argument(
         "--time_limit", type=int, default=1200, help="Time limit for solver."
     )
+    parser.add_argument(
+        "--no_prune_arcs",
+        dest="prune_arcs",
+        action="store_false",
+        help="keep case connections that cannot be assigned in time.",
+    )
+    parser.add_argument(
+        "--formulation",
+        type=str,
+        default="bigm",
+        choices=["bigm", "linear"],
+        help="model no case overlap as gdp disjunction or linear constraints.",
+    )
+    parser.add_argument(
+        "--solver",
+        type=str,
+        default="cbc",
+        choices=list(SOLVER_PLUGINS),
+        help="Solver backend.",
+    )
+    parser.add_argument(
+        "--executable",
+        type=str,
+        default=None,
+        help="Path of the solver executable, defaults to the one on PATH.",
+    )
+    parser.add_argument(
+        "--threads", type=int, default=None, help="Number of solver threads."
+    )
+    parser.add_argument(
+        "--mip_gap", type=float, default=None, help="Relative MIP gap."
+    )
+    parser.add_argument(
+        "--tee", action="store_true", help="Stream the solver log."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of days optimised in parallel processes.",
+    )
+    parser.add_argument(
+        "--warmstart",
+        action="store_true",
+        help="Start the solver from the given or a greedy schedule.",
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        default="mip",
+        choices=ENGINES,
+        help=(
+            "Solve with the MIP, the greedy and local search heuristic or "
+            "route generation."
+        ),
+    )
+    parser.add_argument(
+        "--clusters",
+        type=int,
+        default=1,
+        help="Number of geographic clusters solved as separate models.",
+    )
     args = parser.parse_args()
 
     main(
@@ -892,4 +1820,15 @@ if __name__ == "__main__":
         carbon_reduction=args.carbon_reduction,
         transport=args.transport,
         time_limit=args.time_limit,
+        prune_arcs=args.prune_arcs,
+        formulation=args.formulation,
+        backend=args.solver,
+        executable=args.executable,
+        threads=args.threads,
+        mip_gap=args.mip_gap,
+        tee=args.tee,
+        workers=args.workers,
+        warmstart=args.warmstart,
+        engine=args.engine,
+        clusters=args.clusters,
     )
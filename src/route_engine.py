@@ -0,0 +1,237 @@
+import time
+
+import numpy as np
+import pyomo.environ as pe
+
+from src.heuristic import LocalSearch
+from src.solver import ModelSolver, SolveStats
+
+# objective penalty of a session that no selected route covers
+UNCOVERED_PENALTY = 1e4
+
+
+class RouteGeneration:
+    def __init__(
+        self,
+        search: LocalSearch,
+        home_start: dict,
+        home_end: dict,
+        solver: ModelSolver,
+    ) -> None:
+        """Column generation of caregiver routes with a set-partitioning LP.
+
+        The restricted master LP selects one route per caregiver so that every
+        session is covered exactly once. The pricing subproblem finds the route
+        of most negative reduced cost for every caregiver: sessions are ordered
+        by time, so routes are paths in an acyclic graph and a shortest path
+        over the duals is exact. Routes are scored like the local search.
+
+        Parameters:
+            search (LocalSearch): Costs, masks and initial routes of caregiver
+                positions.
+            home_start (dict): First dummy session of every caregiver position.
+            home_end (dict): Last dummy session of every caregiver position.
+            solver (ModelSolver): Solver of the master LP and MIP.
+        """
+        self.search = search
+        self.home_start = home_start
+        self.home_end = home_end
+        self.solver = solver
+        self.sessions = [
+            case
+            for case in np.argsort(search.rank).tolist()
+            if case not in home_start.values()
+            and case not in home_end.values()
+        ]
+
+        # routes as (caregiver, cases) with their costs
+        self.columns = []
+        self.costs = []
+        self._known = set()
+        for caregiver in home_start:
+            self.add_column(
+                caregiver, [home_start[caregiver], home_end[caregiver]]
+            )
+            route = search.routes.get(caregiver)
+            if route is not None and not np.isinf(search.costs[caregiver]):
+                self.add_column(caregiver, route)
+
+    def add_column(self, caregiver: int, route: list) -> bool:
+        """Add a route to the master unless it is already known."""
+        column = (caregiver, tuple(route))
+        if column in self._known:
+            return False
+        self._known.add(column)
+        self.columns.append(column)
+        self.costs.append(self.search.route_cost(caregiver, route))
+        return True
+
+    def _arc_costs(self, drives: bool) -> np.ndarray:
+        """Cases x cases connection costs of a transport (inf if too late)."""
+        search = self.search
+        commute = search.commute if drives else search.commute_bicycling
+        down_time = search.start_times[None, :] - (
+            search.end_times[:, None] + commute
+        )
+        feasible = down_time >= 0
+        cost = commute + 5 * (down_time < 30)
+        if drives and search.commute_meters is not None:
+            cost = cost + search.commute_meters / 1000
+        return np.where(feasible, cost, np.inf)
+
+    def create_master(self, relax: bool = True) -> pe.ConcreteModel:
+        """Generate the set-partitioning master over the known routes."""
+        model = pe.ConcreteModel()
+        model.ROUTES = pe.Set(initialize=range(len(self.columns)))
+        model.SESSIONS = pe.Set(initialize=self.sessions)
+        model.CAREGIVERS = pe.Set(initialize=list(self.home_start))
+
+        model.ROUTE_SELECTED = pe.Var(
+            model.ROUTES,
+            domain=pe.NonNegativeReals if relax else pe.Binary,
+            bounds=(0, 1),
+        )
+        model.UNCOVERED = pe.Var(model.SESSIONS, domain=pe.NonNegativeReals)
+
+        model.OBJECTIVE = pe.Objective(
+            expr=sum(
+                cost * model.ROUTE_SELECTED[route]
+                for route, cost in enumerate(self.costs)
+            )
+            + UNCOVERED_PENALTY * pe.summation(model.UNCOVERED),
+            sense=pe.minimize,
+        )
+
+        covering = {session: [] for session in self.sessions}
+        routes_of = {caregiver: [] for caregiver in self.home_start}
+        for route, (caregiver, cases) in enumerate(self.columns):
+            routes_of[caregiver].append(route)
+            for case in cases[1:-1]:
+                covering[case].append(route)
+
+        # every session is covered by exactly one selected route
+        def session_covered(model: pe.ConcreteModel, session: int):
+            routes = covering[session]
+            return (
+                sum(model.ROUTE_SELECTED[route] for route in routes)
+                + model.UNCOVERED[session]
+                == 1
+            )
+
+        # every caregiver drives exactly one route
+        def caregiver_route(model: pe.ConcreteModel, caregiver: int):
+            routes = routes_of[caregiver]
+            return sum(model.ROUTE_SELECTED[route] for route in routes) == 1
+
+        model.SESSION_COVERED = pe.Constraint(
+            model.SESSIONS, rule=session_covered
+        )
+        model.CAREGIVER_ROUTE = pe.Constraint(
+            model.CAREGIVERS, rule=caregiver_route
+        )
+        if relax:
+            model.dual = pe.Suffix(direction=pe.Suffix.IMPORT)
+        return model
+
+    def price(self, session_duals: np.ndarray, caregiver_duals: dict) -> int:
+        """Add the route of most negative reduced cost of every caregiver.
+
+        Returns:
+            int: Number of routes added.
+        """
+        arc_costs = {
+            drives: self._arc_costs(drives)
+            for drives in set(self.search.caregiver_drives.tolist())
+        }
+        n_added = 0
+        for caregiver in self.home_start:
+            cost = arc_costs[bool(self.search.caregiver_drives[caregiver])]
+            start, end = self.home_start[caregiver], self.home_end[caregiver]
+            nodes = [start] + [
+                case
+                for case in self.sessions
+                if self.search.task_mask[case, caregiver]
+            ]
+
+            # shortest path from the first dummy session in visiting order
+            label = np.full(len(nodes), np.inf)
+            label[0] = 0
+            previous = np.full(len(nodes), -1)
+            for pos in range(1, len(nodes)):
+                values = (
+                    label[:pos]
+                    + cost[nodes[:pos], nodes[pos]]
+                    - session_duals[nodes[pos]]
+                )
+                best = int(np.argmin(values))
+                label[pos], previous[pos] = values[best], best
+
+            # close the route at the last dummy session
+            values = label + cost[nodes, end]
+            pos = int(np.argmin(values))
+            if values[pos] - caregiver_duals[caregiver] >= -1e-6:
+                continue
+            route = [end]
+            while pos >= 0:
+                route.append(nodes[pos])
+                pos = previous[pos]
+            if self.add_column(caregiver, route[::-1]):
+                n_added += 1
+        return n_added
+
+    def run(self, time_limit: float = 1200, max_iterations: int = 100) -> dict:
+        """Generate routes until none prices out, then solve the master MIP.
+
+        Parameters:
+            time_limit (float, optional): Time limit of the route generation in
+                seconds. Defaults to 1200.
+            max_iterations (int, optional): Maximum number of pricing rounds.
+                Defaults to 100.
+
+        Returns:
+            dict: Selected route of every caregiver position.
+        """
+        deadline = time.perf_counter() + time_limit
+        for iteration in range(max_iterations):
+            master = self.create_master(relax=True)
+            self.solver.solve(master)
+            session_duals = np.zeros(len(self.search.start_times))
+            for session in self.sessions:
+                session_duals[session] = master.dual.get(
+                    master.SESSION_COVERED[session], 0
+                )
+            caregiver_duals = {
+                caregiver: master.dual.get(
+                    master.CAREGIVER_ROUTE[caregiver], 0
+                )
+                for caregiver in self.home_start
+            }
+
+            n_added = self.price(session_duals, caregiver_duals)
+            print(
+                f"Route generation round {iteration}: LP objective "
+                f"{pe.value(master.OBJECTIVE):.1f}, {n_added} routes added"
+            )
+            if not n_added or time.perf_counter() > deadline:
+                break
+
+        self.master = self.create_master(relax=False)
+        self.stats = self.solver.solve(self.master)
+        routes = {}
+        for route, (caregiver, cases) in enumerate(self.columns):
+            value = self.master.ROUTE_SELECTED[route].value
+            if value is not None and value > 0.5:
+                routes[caregiver] = list(cases)
+        return routes
+
+    def solve_stats(self, wall_time: float) -> SolveStats:
+        """Statistics of the master MIP over the whole route generation."""
+        return SolveStats(
+            backend=f"routes/{self.stats.backend}",
+            termination_condition=self.stats.termination_condition,
+            objective=self.stats.objective,
+            bound=self.stats.bound,
+            gap=self.stats.gap,
+            nodes=self.stats.nodes,
+            wall_time=wall_time,
+        )
@@ -1,153 +1,363 @@
-from itertools import product
-from typing import Tuple
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Union
 
 import googlemaps
+import numpy as np
 import pandas as pd
+from googlemaps.exceptions import ApiError, Timeout, TransportError
 
 from config.config_data import EXCEL_FILE
-from config.config_routing import COMMUTE_METHOD, GOOGLE_API, ROUTE_DIRECTION
+from config.config_routing import (
+    COMMUTE_METHOD,
+    GOOGLE_API,
+    ROAD_GRAPH_DIR,
+    ROUTE_DIRECTION,
+    ROUTING_ENGINE,
+)
 from src.dataloader import load_data
+from src.road_routing import RoadRouter
+from src.routing_cache import (
+    RoutingCache,
+    commute_csvs,
+    get_coordinates,
+    id_coordinates,
+)
 
+# limits of a single distance matrix request
+MAX_ORIGINS = 25
+MAX_DESTINATIONS = 25
+MAX_ELEMENTS = 100
 
-def get_coordinate_tuple(
-    df: pd.DataFrame, constraint: pd.Series
-) -> Tuple[float]:
-    """Extracts latitude and longitude from a DataFrame based on a given constraint.
+# api statuses worth retrying
+RETRY_STATUSES = ["OVER_QUERY_LIMIT", "UNKNOWN_ERROR"]
 
-    Parameters:
-    - df (pd.DataFrame): DataFrame with latitude and longitude information.
-    - constraint (pd.Series): Boolean Series as a constraint for row selection.
 
-    Returns:
-    Tuple[float]: Tuple containing latitude and longitude coordinates.
-    """
-    df = df.copy()
+class RateLimiter:
+    def __init__(self, rate: float) -> None:
+        """Token bucket shared by threads, refilled with rate tokens per second."""
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
 
-    Lat = df.loc[constraint, "Latitude"]
-    Long = df.loc[constraint, "Longitude"]
-    coord_tuple = (Lat, Long)
+    def acquire(self, tokens: float = 1) -> None:
+        """Block until the tokens are available and take them."""
+        # requests larger than the bucket wait for a full one
+        tokens = min(tokens, self.rate)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.rate, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
 
-    return coord_tuple
 
+class DistanceMatrixFetcher:
+    def __init__(
+        self,
+        client: googlemaps.Client,
+        mode: str = COMMUTE_METHOD,
+        workers: int = 8,
+        elements_per_second: float = 1000,
+        retries: int = 5,
+        backoff: float = 1.0,
+        cache: RoutingCache = None,
+    ) -> None:
+        """Fetch origins x destinations matrices in concurrent request blocks.
 
-def gmaps_api_request(
-    origins: Tuple[float], destination: Tuple[float]
-) -> Tuple[int]:
-    """Fetches distance & duration from Google Maps API for given origins & destination.
+        Origins and destinations are packed into blocks that fill the element
+        limits of one request. Blocks run in a thread pool under a shared limit
+        of elements per second, and transient failures are retried with
+        exponential backoff. With a cache, only blocks with commutes missing
+        from the cache are requested and their results are stored.
 
-    Parameters:
-    - origins (Tuple[float]): Tuple with origin coordinates (lat, lon).
-    - destination (Tuple[float]): Tuple with destination coordinates (lat, lon).
+        Parameters:
+        - client (googlemaps.Client): Client for the distance matrix api, e.g.
+            pointed at a local stub server with base_url.
+        - mode (str): Commute method, driving or bicycling.
+        - workers (int): Number of concurrent requests.
+        - elements_per_second (float): Maximum of elements requested per second.
+        - retries (int): Retries of a block after transient failures.
+        - backoff (float): Seconds to wait before the first retry, doubled after
+            every further one.
+        - cache (RoutingCache): Persistent cache of fetched commutes.
+        """
+        self.client = client
+        self.mode = mode
+        self.workers = workers
+        self.limiter = RateLimiter(elements_per_second)
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        # requests sent, counted across threads
+        self.n_requests = 0
+        self._lock = threading.Lock()
 
-    Returns:
-    Tuple[int]: Distance (meters) and duration (seconds) of the route.
-                If an error occurs, both values are 0.
-    """
-    result = gmaps.distance_matrix(origins, destination, mode=COMMUTE_METHOD)
-    try:
-        result_dist = result["rows"][0]["elements"][0]["distance"]["value"]
-    except KeyError:
-        result_dist = 0
-    try:
-        result_time = result["rows"][0]["elements"][0]["duration"]["value"]
-    except KeyError:
-        result_time = 0
+    @staticmethod
+    def blocks(n_origins: int, n_destinations: int) -> list[tuple]:
+        """Split origins x destinations into blocks of full requests.
 
-    return result_dist, result_time
+        Returns:
+        list[tuple]: Origin and destination slices of every block.
+        """
+        n_dest = min(n_destinations, MAX_DESTINATIONS, MAX_ELEMENTS)
+        n_orig = min(n_origins, MAX_ORIGINS, MAX_ELEMENTS // max(n_dest, 1))
+        return [
+            (slice(orig, orig + n_orig), slice(dest, dest + n_dest))
+            for orig in range(0, n_origins, n_orig)
+            for dest in range(0, n_destinations, n_dest)
+        ]
 
+    def _request(
+        self, origins: np.ndarray, destinations: np.ndarray
+    ) -> Tuple[np.ndarray]:
+        """Fetch one block, retrying transient failures.
 
-if __name__ == "__main__":
-    _, clients, caregivers = load_data(EXCEL_FILE)
+        Returns:
+        Tuple[np.ndarray]: Seconds and meters of the block, 0 where the api
+            found no route.
+        """
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire(len(origins) * len(destinations))
+            try:
+                result = self.client.distance_matrix(
+                    [tuple(coord) for coord in origins],
+                    [tuple(coord) for coord in destinations],
+                    mode=self.mode,
+                )
+                break
+            except (Timeout, TransportError) as error:
+                failure = error
+            except ApiError as error:
+                if error.status not in RETRY_STATUSES:
+                    raise
+                failure = error
+            if attempt == self.retries:
+                raise failure
+            time.sleep(self.backoff * 2**attempt)
+        with self._lock:
+            self.n_requests += 1
 
-    gmaps = googlemaps.Client(key=GOOGLE_API)
+        seconds = np.zeros((len(origins), len(destinations)))
+        meters = np.zeros((len(origins), len(destinations)))
+        for i, row in enumerate(result["rows"]):
+            for j, element in enumerate(row["elements"]):
+                seconds[i, j] = element.get("duration", {}).get("value", 0)
+                meters[i, j] = element.get("distance", {}).get("value", 0)
+        return seconds, meters
 
-    # empty list - will be used to store calculated distances
-    list_seconds = []
-    list_distance = []
+    def fetch(
+        self, origins: np.ndarray, destinations: np.ndarray
+    ) -> Tuple[np.ndarray]:
+        """Fetch the commute of all origins x destinations.
 
-    if ROUTE_DIRECTION == "clients":
-        combs_list = list(product(clients["ID Client"], clients["ID Client"]))
+        Parameters:
+        - origins (np.ndarray): Latitude and longitude of every origin.
+        - destinations (np.ndarray): Latitude and longitude of every destination.
 
-        # Loop through each row in the data frame using pairwise
-        for client1, client2 in combs_list:
-            if client1 == client2:
-                result_dist, result_time = 0, 0
-            else:
-                # Assign latitude and longitude as origin/departure points
-                origins = get_coordinate_tuple(
-                    clients, clients["ID Client"] == client1
-                )
-                destination = get_coordinate_tuple(
-                    clients, clients["ID Client"] == client2
-                )
+        Returns:
+        Tuple[np.ndarray]: Origins x destinations seconds and meters.
+        """
+        shape = (len(origins), len(destinations))
+        if self.cache is not None:
+            seconds, meters = self.cache.lookup(
+                origins, destinations, self.mode
+            )
+            missing = np.isnan(seconds)
+        else:
+            seconds, meters = np.zeros(shape), np.zeros(shape)
+            missing = np.ones(shape, dtype=bool)
 
-                # pass origin and destination variables to distance_matrix
-                result_dist, result_time = gmaps_api_request(
-                    origins, destination
-                )
+        # origins and destinations with most missing commutes share blocks
+        orig_order = np.argsort(-missing.sum(axis=1), kind="stable")
+        dest_order = np.argsort(-missing.sum(axis=0), kind="stable")
+        missing = missing[np.ix_(orig_order, dest_order)]
+        blocks = [
+            (orig_order[orig], dest_order[dest])
+            for orig, dest in self.blocks(*shape)
+            if missing[orig, dest].any()
+        ]
 
-            # append result to list
-            list_seconds.append(result_time)
-            list_distance.append(result_dist)
+        n_requests = self.n_requests
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(
+                lambda block: self._request(
+                    origins[block[0]], destinations[block[1]]
+                ),
+                blocks,
+            )
+            for (orig, dest), (block_seconds, block_meters) in zip(
+                blocks, results
+            ):
+                seconds[np.ix_(orig, dest)] = block_seconds
+                meters[np.ix_(orig, dest)] = block_meters
+                if self.cache is not None:
+                    self.cache.store(
+                        origins[orig],
+                        destinations[dest],
+                        block_seconds,
+                        block_meters,
+                        self.mode,
+                    )
+        print(
+            f"Fetched {len(origins)}x{len(destinations)} {self.mode} commutes "
+            f"in {self.n_requests - n_requests} requests"
+        )
+        return seconds, meters
 
-    elif ROUTE_DIRECTION == "care_client":
-        combs_list = []
 
-        for care_id in caregivers["ID Intervenant"].unique():
-            # Loop through each row in the data frame using pairwise
-            for client_id in clients["ID Client"].unique():
-                # Assign latitude and longitude as origin/departure points
-                origins = get_coordinate_tuple(
-                    caregivers, caregivers["ID Intervenant"] == care_id
-                )
-                destination = get_coordinate_tuple(
-                    clients, clients["ID Client"] == client_id
-                )
+def commute_table(
+    fetcher: Union[DistanceMatrixFetcher, RoadRouter],
+    clients: pd.DataFrame,
+    caregivers: pd.DataFrame,
+    route_direction: str,
+) -> pd.DataFrame:
+    """Fetches the commutes of one route direction.
 
-                # pass origin and destination variables to distance_matrix
-                result_dist, result_time = gmaps_api_request(
-                    origins, destination
-                )
+    Parameters:
+    - fetcher (DistanceMatrixFetcher | RoadRouter): Fetcher of the commute
+        method, from the api or the local road graph.
+    - clients (pd.DataFrame): Clients sheet.
+    - caregivers (pd.DataFrame): Caregivers sheet.
+    - route_direction (str): One of clients, care_client or client_care.
 
-                # append result to list
-                list_seconds.append(result_time)
-                list_distance.append(result_dist)
-                combs_list.append((care_id, client_id))
+    Returns:
+    pd.DataFrame: One row per (source, destination) pair as saved to the
+        commute csvs.
+    """
+    client_coords = get_coordinates(clients, "ID Client")
+    care_coords = get_coordinates(caregivers, "ID Intervenant")
 
-    elif ROUTE_DIRECTION == "client_care":
-        combs_list = []
+    if route_direction == "clients":
+        sources = destinations = client_coords
+    elif route_direction == "care_client":
+        sources, destinations = care_coords, client_coords
+    elif route_direction == "client_care":
+        sources, destinations = client_coords, care_coords
+    else:
+        raise ValueError(f"Unknown route direction: {route_direction}")
 
-        for care_id in caregivers["ID Intervenant"].unique():
-            # Loop through each row in the data frame using pairwise
-            for client_id in clients["ID Client"].unique():
-                # Assign latitude and longitude from the next row as the destination point
-                origins = get_coordinate_tuple(
-                    clients, clients["ID Client"] == client_id
-                )
-                destination = get_coordinate_tuple(
-                    caregivers, caregivers["ID Intervenant"] == care_id
-                )
-
-                # pass origin and destination variables to distance_matrix
-                result_dist, result_time = gmaps_api_request(
-                    origins, destination
-                )
+    seconds, meters = fetcher.fetch(
+        sources.to_numpy(), destinations.to_numpy()
+    )
+    if route_direction == "clients":
+        # no commute from a client to the same client
+        np.fill_diagonal(seconds, 0)
+        np.fill_diagonal(meters, 0)
 
-                # append result to list
-                list_seconds.append(result_time)
-                list_distance.append(result_dist)
-                combs_list.append((client_id, care_id))
+    orig, dest = np.meshgrid(
+        np.arange(len(sources)), np.arange(len(destinations)), indexing="ij"
+    )
+    if route_direction == "client_care":
+        # caregivers in the outer loop as before
+        orig, dest = orig.T, dest.T
+    orig, dest = orig.ravel(), dest.ravel()
 
-    # create output df and save
+    source_ids = sources.index.to_numpy()[orig]
+    dest_ids = destinations.index.to_numpy()[dest]
     df = pd.DataFrame(
         {
-            ROUTE_DIRECTION: combs_list,
-            "commute_seconds": list_seconds,
-            "commute_meters": list_distance,
+            route_direction: list(zip(source_ids, dest_ids)),
+            "commute_seconds": seconds[orig, dest].astype(int),
+            "commute_meters": meters[orig, dest].astype(int),
+            "source": source_ids,
+            "destination": dest_ids,
         }
     )
-    df["source"], df["destination"] = zip(*df[ROUTE_DIRECTION])
-    df["commute_method"] = COMMUTE_METHOD
-    df.to_csv(
-        f"data/commute_{COMMUTE_METHOD}_{ROUTE_DIRECTION}.csv", index=False
+    df["commute_method"] = fetcher.mode
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fetch commute times and distances from the routing api."
+    )
+    parser.add_argument(
+        "--methods",
+        nargs="+",
+        default=[COMMUTE_METHOD],
+        choices=["driving", "bicycling"],
+        help="Commute methods to fetch.",
+    )
+    parser.add_argument(
+        "--directions",
+        nargs="+",
+        default=[ROUTE_DIRECTION],
+        choices=["clients", "care_client", "client_care"],
+        help="Route directions to fetch.",
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        default=ROUTING_ENGINE,
+        choices=["google", "local"],
+        help="Route with the api or offline on the exported OSM graphs.",
+    )
+    parser.add_argument(
+        "--graph_dir",
+        type=str,
+        default=ROAD_GRAPH_DIR,
+        help="Directory of the OSM graphs of the local engine.",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=8, help="Concurrent requests."
+    )
+    parser.add_argument(
+        "--elements_per_second",
+        type=float,
+        default=1000,
+        help="Maximum of matrix elements requested per second.",
+    )
+    parser.add_argument(
+        "--base_url",
+        type=str,
+        default=None,
+        help="Base url of the api, e.g. of a local stub server.",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default="data/routing_cache.sqlite",
+        help="Routing cache, only commutes missing from it are fetched.",
+    )
+    args = parser.parse_args()
+
+    _, clients, caregivers = load_data(EXCEL_FILE)
+
+    if args.engine == "google":
+        client_kwargs = {"key": GOOGLE_API}
+        if args.base_url:
+            client_kwargs["base_url"] = args.base_url
+        gmaps = googlemaps.Client(**client_kwargs)
+
+    cache = RoutingCache(args.cache)
+    # commutes of the csvs are not fetched again
+    cache.seed(
+        [file for method in args.methods for file in commute_csvs(method)],
+        id_coordinates(clients, caregivers),
     )
+    for method in args.methods:
+        if args.engine == "local":
+            fetcher = RoadRouter(method, args.graph_dir, cache=cache)
+        else:
+            fetcher = DistanceMatrixFetcher(
+                gmaps,
+                mode=method,
+                workers=args.workers,
+                elements_per_second=args.elements_per_second,
+                cache=cache,
+            )
+        for direction in args.directions:
+            df = commute_table(fetcher, clients, caregivers, direction)
+            df.to_csv(f"data/commute_{method}_{direction}.csv", index=False)
+    print(f"Routing cache: {cache.stats()}")
+    cache.close()
@@ -0,0 +1,323 @@
+import sqlite3
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+# decimals of the coordinates keying the cache, about a meter
+COORDINATE_DECIMALS = 5
+
+
+def get_coordinates(df: pd.DataFrame, id_column: str) -> pd.DataFrame:
+    """Gets latitude and longitude of every unique ID in one lookup table.
+
+    Parameters:
+    - df (pd.DataFrame): DataFrame with latitude and longitude information.
+    - id_column (str): Column of the IDs.
+
+    Returns:
+    pd.DataFrame: Latitude and longitude indexed by ID in order of appearance.
+    """
+    return df.drop_duplicates(id_column).set_index(id_column)[
+        ["Latitude", "Longitude"]
+    ]
+
+
+def id_coordinates(
+    clients: pd.DataFrame, caregivers: pd.DataFrame
+) -> pd.DataFrame:
+    """Gets latitude and longitude of all client and caregiver IDs.
+
+    Parameters:
+    - clients (pd.DataFrame): Clients sheet.
+    - caregivers (pd.DataFrame): Caregivers sheet.
+
+    Returns:
+    pd.DataFrame: Latitude and longitude indexed by ID, clients first.
+    """
+    coordinates = pd.concat(
+        [
+            get_coordinates(clients, "ID Client"),
+            get_coordinates(caregivers, "ID Intervenant"),
+        ]
+    )
+    return coordinates[~coordinates.index.duplicated()]
+
+
+def commute_csvs(kind: str, data_dir: str = "data") -> list[Path]:
+    """Gets the fetched commute csvs of a kind, without the merged one.
+
+    Parameters:
+    - kind (str): Kind of commute, driving or bicycling.
+    - data_dir (str): Directory of the commute csvs.
+
+    Returns:
+    list[Path]: Paths of the commute csvs of every route direction.
+    """
+    return [
+        path
+        for path in sorted(Path(data_dir).glob(f"commute_{kind}_*.csv"))
+        if path.name != f"commute_{kind}_all.csv"
+    ]
+
+
+def coordinate_keys(coordinates: np.ndarray) -> np.ndarray:
+    """Rounds latitude and longitude to the integer keys of the cache."""
+    return np.round(
+        np.asarray(coordinates, dtype=float) * 10**COORDINATE_DECIMALS
+    ).astype(np.int64)
+
+
+class RoutingCache:
+    def __init__(self, path: str = "data/routing_cache.sqlite") -> None:
+        """Persistent commutes keyed by rounded origin, destination and mode.
+
+        Parameters:
+        - path (str, optional): SQLite file of the cache. Defaults to
+            "data/routing_cache.sqlite".
+        """
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS commutes (
+                origin_lat INTEGER,
+                origin_lon INTEGER,
+                dest_lat INTEGER,
+                dest_lon INTEGER,
+                mode TEXT,
+                seconds REAL,
+                meters REAL,
+                PRIMARY KEY (origin_lat, origin_lon, dest_lat, dest_lon, mode)
+            )
+            """
+        )
+        # commute csvs imported by seed and their modification time
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS seeded_files (
+                path TEXT PRIMARY KEY,
+                mtime REAL
+            )
+            """
+        )
+        # pairs found and not found by lookup
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, mode: str) -> int:
+        """Number of cached commutes of a mode."""
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM commutes WHERE mode = ?", (mode,)
+        ).fetchone()[0]
+
+    def lookup(
+        self, origins: np.ndarray, destinations: np.ndarray, mode: str
+    ) -> Tuple[np.ndarray]:
+        """Look up the commute of all origins x destinations.
+
+        Parameters:
+        - origins (np.ndarray): Latitude and longitude of every origin.
+        - destinations (np.ndarray): Latitude and longitude of every
+            destination.
+        - mode (str): Commute method, driving or bicycling.
+
+        Returns:
+        Tuple[np.ndarray]: Origins x destinations seconds and meters, NaN
+            where the commute is not cached.
+        """
+        cached = pd.read_sql_query(
+            "SELECT origin_lat, origin_lon, dest_lat, dest_lon, seconds, meters "
+            "FROM commutes WHERE mode = ?",
+            self.connection,
+            params=(mode,),
+        ).set_index(["origin_lat", "origin_lon", "dest_lat", "dest_lon"])
+
+        origin_keys = coordinate_keys(origins).reshape(-1, 2)
+        dest_keys = coordinate_keys(destinations).reshape(-1, 2)
+        orig, dest = np.meshgrid(
+            np.arange(len(origin_keys)),
+            np.arange(len(dest_keys)),
+            indexing="ij",
+        )
+        keys = pd.MultiIndex.from_arrays(
+            [
+                origin_keys[orig.ravel(), 0],
+                origin_keys[orig.ravel(), 1],
+                dest_keys[dest.ravel(), 0],
+                dest_keys[dest.ravel(), 1],
+            ]
+        )
+        found = cached.reindex(keys)
+        shape = (len(origin_keys), len(dest_keys))
+        seconds = found["seconds"].to_numpy(dtype=float).reshape(shape)
+        meters = found["meters"].to_numpy(dtype=float).reshape(shape)
+
+        n_found = int((~np.isnan(seconds)).sum())
+        self.hits += n_found
+        self.misses += seconds.size - n_found
+        return seconds, meters
+
+    def store(
+        self,
+        origins: np.ndarray,
+        destinations: np.ndarray,
+        seconds: np.ndarray,
+        meters: np.ndarray,
+        mode: str,
+    ) -> None:
+        """Store the commute of all origins x destinations."""
+        origin_keys = coordinate_keys(origins).reshape(-1, 2)
+        dest_keys = coordinate_keys(destinations).reshape(-1, 2)
+        orig, dest = np.meshgrid(
+            np.arange(len(origin_keys)),
+            np.arange(len(dest_keys)),
+            indexing="ij",
+        )
+        self.store_pairs(
+            origin_keys[orig.ravel()],
+            dest_keys[dest.ravel()],
+            np.asarray(seconds).ravel(),
+            np.asarray(meters).ravel(),
+            mode,
+        )
+
+    def store_pairs(
+        self,
+        origin_keys: np.ndarray,
+        dest_keys: np.ndarray,
+        seconds: np.ndarray,
+        meters: np.ndarray,
+        mode: str,
+        replace: bool = True,
+    ) -> None:
+        """Store commutes of (origin, destination) pairs of coordinate keys.
+
+        Without replace, pairs that are already cached keep their commute.
+        """
+        rows = zip(
+            origin_keys[:, 0].tolist(),
+            origin_keys[:, 1].tolist(),
+            dest_keys[:, 0].tolist(),
+            dest_keys[:, 1].tolist(),
+            [mode] * len(seconds),
+            np.asarray(seconds, dtype=float).tolist(),
+            np.asarray(meters, dtype=float).tolist(),
+        )
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO commutes "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def import_table(
+        self, commute_df: pd.DataFrame, coordinates: pd.DataFrame
+    ) -> None:
+        """Store the commutes of an ID-keyed commute csv.
+
+        Pairs that are already cached keep their commute.
+
+        Parameters:
+        - commute_df (pd.DataFrame): Commutes with source, destination,
+            commute_method, commute_seconds and commute_meters columns.
+        - coordinates (pd.DataFrame): Latitude and longitude by client and
+            caregiver ID, as from get_coordinates.
+        """
+        commute_df = commute_df[
+            commute_df["source"].isin(coordinates.index)
+            & commute_df["destination"].isin(coordinates.index)
+        ]
+        for mode, df in commute_df.groupby("commute_method"):
+            self.store_pairs(
+                coordinate_keys(coordinates.loc[df["source"]].to_numpy()),
+                coordinate_keys(coordinates.loc[df["destination"]].to_numpy()),
+                df["commute_seconds"].to_numpy(),
+                df["commute_meters"].to_numpy(),
+                mode,
+                replace=False,
+            )
+
+    def seed(self, files: list[Path], coordinates: pd.DataFrame) -> int:
+        """Import the commute csvs that changed since they were last imported.
+
+        Parameters:
+        - files (list[Path]): Commute csvs, as from commute_csvs.
+        - coordinates (pd.DataFrame): Latitude and longitude by client and
+            caregiver ID, as from id_coordinates.
+
+        Returns:
+        int: Number of imported csvs.
+        """
+        n_files = 0
+        for file in files:
+            path = str(Path(file).resolve())
+            mtime = Path(file).stat().st_mtime
+            seeded = self.connection.execute(
+                "SELECT mtime FROM seeded_files WHERE path = ?", (path,)
+            ).fetchone()
+            if seeded is not None and seeded[0] == mtime:
+                continue
+
+            self.import_table(pd.read_csv(file), coordinates)
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO seeded_files VALUES (?, ?)",
+                    (path, mtime),
+                )
+            n_files += 1
+        if n_files:
+            print(f"Imported {n_files} commute csvs into the routing cache")
+        return n_files
+
+    def table(
+        self, sources: pd.DataFrame, destinations: pd.DataFrame, mode: str
+    ) -> pd.DataFrame:
+        """Assemble the cached commutes of all sources x destinations by ID.
+
+        Parameters:
+        - sources (pd.DataFrame): Coordinates by ID as from get_coordinates.
+        - destinations (pd.DataFrame): Coordinates by ID as from
+            get_coordinates.
+        - mode (str): Commute method, driving or bicycling.
+
+        Returns:
+        pd.DataFrame: One row per cached (source, destination) pair in the
+            layout of the commute csvs.
+        """
+        seconds, meters = self.lookup(
+            sources.to_numpy(), destinations.to_numpy(), mode
+        )
+        orig, dest = np.nonzero(~np.isnan(seconds))
+        source_ids = sources.index.to_numpy()[orig]
+        dest_ids = destinations.index.to_numpy()[dest]
+        missing = seconds.size - len(orig)
+        if missing:
+            print(
+                f"{missing} {mode} commutes are not in the routing cache, "
+                "fetch them with src/routing.py"
+            )
+        df = pd.DataFrame(
+            {
+                "pair": list(zip(source_ids, dest_ids)),
+                "commute_seconds": seconds[orig, dest].astype(int),
+                "commute_meters": meters[orig, dest].astype(int),
+                "source": source_ids,
+                "destination": dest_ids,
+            }
+        )
+        df["commute_method"] = mode
+        return df
+
+    def stats(self) -> dict:
+        """Lookup hits and misses since the cache was opened."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else None,
+        }
+
+    def close(self) -> None:
+        """Close the connection to the cache file."""
+        self.connection.close()
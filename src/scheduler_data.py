@@ -0,0 +1,311 @@
+import ast
+import json
+import time
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.commute_estimator import CommuteEstimator
+from src.dataloader import load_commute_store
+from src.routing_cache import get_coordinates
+from src.workbook import read_sheet
+
+
+class SchedulerData:
+    def __init__(
+        self,
+        sessions: pd.DataFrame,
+        caregivers: pd.DataFrame,
+        client_ids: list,
+        caregiver_transport: pd.DataFrame,
+        caregiver_avail: pd.DataFrame,
+        commute_ids: np.ndarray,
+        commute: dict[str, np.ndarray],
+        transport: str = "license",
+        clients: pd.DataFrame = None,
+        schedule_dir: str = None,
+    ) -> None:
+        """Inputs of the care scheduler shared by all days.
+
+        Commute matrices are dense float32 arrays of seconds and meters per kind
+        over commute_ids (sources in rows, destinations in columns, NaN if the
+        commute is unknown), as from load_commute_store.
+
+        Parameters:
+            sessions (pd.DataFrame): Schedule of all days as from create_schedule_df.
+            caregivers (pd.DataFrame): Caregivers sheet.
+            client_ids (list): IDs of the clients sheet.
+            caregiver_transport (pd.DataFrame): License of caregivers.
+            caregiver_avail (pd.DataFrame): Days where caregivers are not available.
+            commute_ids (np.ndarray): Client / caregiver IDs of the matrix rows.
+            commute (dict[str, np.ndarray]): Commute matrices by name.
+            transport (str, optional): Kind of caregiver transport. Defaults to "license".
+            clients (pd.DataFrame, optional): Clients sheet. Defaults to None.
+            schedule_dir (str, optional): Per-day schedule store as from
+                create_schedule_store, read one day at a time when sessions
+                is None. Defaults to None.
+        """
+        self.sessions = sessions
+        self.caregivers = caregivers
+        self.client_ids = client_ids
+        self.caregiver_transport = caregiver_transport
+        self.caregiver_avail = caregiver_avail
+        self.commute_ids = commute_ids
+        self.commute_index = pd.Index(commute_ids)
+        self.commute = commute
+        self.transport = transport
+        self.clients = clients
+        self.schedule_dir = schedule_dir
+        self.schedule_index = None
+        if sessions is None and schedule_dir is not None:
+            self.schedule_index = json.loads(
+                (Path(schedule_dir) / "index.json").read_text()
+            )
+        # sessions of the days read from the schedule store
+        self._day_sessions = {}
+        # seconds spent by SchedulerData.load
+        self.load_time = None
+
+        # shared memory blocks backing the commute matrices
+        self._shared_memory = []
+        self._owner = False
+
+    @classmethod
+    def load(
+        cls,
+        transport: str = "license",
+        data_dir: str = "data",
+        estimate_missing: bool = True,
+    ) -> "SchedulerData":
+        """Load all scheduler inputs from disk once.
+
+        With estimate_missing, commutes missing between clients and caregivers
+        of the sheets are estimated with fill_missing_commutes.
+        """
+        start_time = time.perf_counter()
+        sessions = caregivers = caregiver_transport = caregiver_avail = None
+        clients = schedule_dir = None
+        client_ids = []
+        if Path(f"{data_dir}/schedule/index.json").exists():
+            # days are read on demand by sessions_for
+            schedule_dir = f"{data_dir}/schedule"
+        else:
+            try:
+                sessions = pd.read_csv(f"{data_dir}/schedule.csv")
+            except FileNotFoundError:
+                print("Session data not found.")
+        try:
+            caregivers = read_sheet(
+                2, f"{data_dir}/ChallengeXHEC23022024.xlsx"
+            )
+            clients = read_sheet(1, f"{data_dir}/ChallengeXHEC23022024.xlsx")
+            client_ids = clients["ID Client"].to_list()
+        except FileNotFoundError:
+            print("Caregiver data not found")
+        try:
+            caregiver_transport = pd.read_csv(
+                f"{data_dir}/caregiver_transport_{transport}.csv"
+            )
+        except FileNotFoundError:
+            print("Caregiver transport data not found")
+        try:
+            caregiver_avail = pd.read_csv(
+                f"{data_dir}/caregiver_avail.csv",
+                converters={
+                    "ID Intervenant": ast.literal_eval,
+                    "UNDISP_DAYS": ast.literal_eval,
+                },
+            )
+        except FileNotFoundError:
+            print("Caregiver availability data not found")
+
+        commute_ids, commute = load_commute_store(data_dir)
+        data = cls(
+            sessions,
+            caregivers,
+            client_ids,
+            caregiver_transport,
+            caregiver_avail,
+            commute_ids,
+            commute,
+            transport=transport,
+            clients=clients,
+            schedule_dir=schedule_dir,
+        )
+        if estimate_missing and clients is not None:
+            coordinates = pd.concat(
+                [
+                    get_coordinates(clients, "ID Client"),
+                    get_coordinates(caregivers, "ID Intervenant"),
+                ]
+            )
+            data.fill_missing_commutes(
+                coordinates[~coordinates.index.duplicated()]
+            )
+        data.load_time = time.perf_counter() - start_time
+        return data
+
+    def sessions_for(self, date: str) -> pd.DataFrame:
+        """Get the sessions of one day."""
+        if self.sessions is not None:
+            return self.sessions[self.sessions.Date == date]
+
+        if date not in self._day_sessions:
+            if date in self.schedule_index["dates"]:
+                self._day_sessions[date] = pd.read_parquet(
+                    Path(self.schedule_dir) / f"{date}.parquet"
+                )
+            else:
+                print(f"No sessions on {date}")
+                self._day_sessions[date] = pd.DataFrame(
+                    columns=self.schedule_index["columns"]
+                )
+        return self._day_sessions[date].copy()
+
+    def max_session_idx(self) -> int:
+        """Get the largest session index of all days."""
+        if self.sessions is not None:
+            return int(self.sessions["idx"].max())
+        return self.schedule_index["max_idx"]
+
+    def commute_positions(self, ids: np.ndarray) -> np.ndarray:
+        """Get rows of the commute matrices for client / caregiver IDs."""
+        positions = self.commute_index.get_indexer(ids)
+        if (positions < 0).any():
+            missing = np.asarray(ids)[positions < 0]
+            raise KeyError(f"No commute data for IDs {missing.tolist()}")
+        return positions
+
+    def fill_missing_commutes(
+        self, coordinates: pd.DataFrame, estimator: CommuteEstimator = None
+    ) -> dict[str, int]:
+        """Estimate the unknown commutes between IDs with coordinates.
+
+        IDs without any commute data, e.g. of simulated clients, are added to
+        the commute matrices. Call before share, as the matrices may grow.
+
+        Parameters:
+            coordinates (pd.DataFrame): Latitude and longitude by client and
+                caregiver ID, as from get_coordinates.
+            estimator (CommuteEstimator, optional): Commute model. Defaults to
+                one calibrated on the known commutes.
+
+        Returns:
+            dict[str, int]: Number of estimated commutes by matrix name.
+        """
+        if estimator is None:
+            estimator = CommuteEstimator.fit(
+                coordinates, self.commute_ids, self.commute
+            )
+
+        new_ids = coordinates.index[
+            ~coordinates.index.isin(self.commute_index)
+        ].to_numpy()
+        if len(new_ids):
+            n_ids = len(self.commute_ids)
+            self.commute_ids = np.concatenate([self.commute_ids, new_ids])
+            self.commute_index = pd.Index(self.commute_ids)
+            for name, matrix in self.commute.items():
+                grown = np.full(
+                    (len(self.commute_ids), len(self.commute_ids)),
+                    np.nan,
+                    dtype=matrix.dtype,
+                )
+                grown[:n_ids, :n_ids] = matrix
+                self.commute[name] = grown
+
+        block = np.ix_(*[self.commute_positions(coordinates.index)] * 2)
+        n_missing = {}
+        for mode in ["driving", "bicycling"]:
+            estimates = estimator.estimate(
+                coordinates.to_numpy(), coordinates.to_numpy(), mode
+            )
+            for unit, estimate in zip(["seconds", "meters"], estimates):
+                matrix = self.commute[f"{mode}_{unit}"]
+                known = matrix[block]
+                missing = np.isnan(known)
+                matrix[block] = np.where(missing, estimate, known)
+                n_missing[f"{mode}_{unit}"] = int(missing.sum())
+        if any(n_missing.values()):
+            print(
+                f"Estimated missing commutes for {len(new_ids)} new IDs: "
+                f"{n_missing}"
+            )
+        return n_missing
+
+    def share(self) -> dict:
+        """Move the commute matrices to shared memory.
+
+        Returns:
+            dict: Picklable handle to rebuild the data context in other processes
+                with SchedulerData.attach.
+        """
+        arrays = {}
+        for name, array in self.commute.items():
+            block = shared_memory.SharedMemory(
+                create=True, size=max(array.nbytes, 1)
+            )
+            shared = np.ndarray(
+                array.shape, dtype=array.dtype, buffer=block.buf
+            )
+            shared[:] = array
+            self.commute[name] = shared
+            self._shared_memory.append(block)
+            arrays[name] = (block.name, array.shape, array.dtype.str)
+        self._owner = True
+
+        return {
+            "sessions": self.sessions,
+            "caregivers": self.caregivers,
+            "client_ids": self.client_ids,
+            "caregiver_transport": self.caregiver_transport,
+            "caregiver_avail": self.caregiver_avail,
+            "commute_ids": self.commute_ids,
+            "transport": self.transport,
+            "clients": self.clients,
+            "schedule_dir": self.schedule_dir,
+            "load_time": self.load_time,
+            "arrays": arrays,
+        }
+
+    @classmethod
+    def attach(cls, handle: dict) -> "SchedulerData":
+        """Rebuild a data context on commute matrices in shared memory."""
+        blocks = []
+        commute = {}
+        for name, (block_name, shape, dtype) in handle["arrays"].items():
+            block = shared_memory.SharedMemory(name=block_name)
+            commute[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            blocks.append(block)
+
+        data = cls(
+            handle["sessions"],
+            handle["caregivers"],
+            handle["client_ids"],
+            handle["caregiver_transport"],
+            handle["caregiver_avail"],
+            handle["commute_ids"],
+            commute,
+            transport=handle["transport"],
+            clients=handle["clients"],
+            schedule_dir=handle["schedule_dir"],
+        )
+        data._shared_memory = blocks
+        data.load_time = handle["load_time"]
+        return data
+
+    def close(self) -> None:
+        """Release the shared memory, freeing it if this context created it."""
+        if self._owner:
+            # keep private copies so the context stays usable
+            self.commute = {
+                name: np.array(array) for name, array in self.commute.items()
+            }
+        for block in self._shared_memory:
+            block.close()
+            if self._owner:
+                block.unlink()
+        self._shared_memory = []
+        self._owner = False
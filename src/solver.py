@@ -0,0 +1,192 @@
+import shutil
+import time
+from dataclasses import asdict, dataclass
+from math import isfinite
+from typing import Optional
+
+import pyomo.environ as pe
+
+# pyomo plugins of the supported backends
+SOLVER_PLUGINS = {
+    "cbc": "cbc",
+    "glpk": "glpk",
+    "highs": "appsi_highs",
+    "gurobi": "gurobi_persistent",
+    "cplex": "cplex_persistent",
+}
+
+# executables of the backends that exchange the model through files
+SOLVER_EXECUTABLES = {"cbc": "cbc", "glpk": "glpsol"}
+
+# backends keeping the model in memory between solves
+PERSISTENT_BACKENDS = ["highs", "gurobi", "cplex"]
+
+# backend specific names of the time limit, relative mip gap and threads
+SOLVER_OPTIONS = {
+    "cbc": {
+        "time_limit": "seconds",
+        "mip_gap": "ratioGap",
+        "threads": "threads",
+    },
+    "glpk": {"time_limit": "tmlim", "mip_gap": "mipgap"},
+    "highs": {"mip_gap": "mip_rel_gap", "threads": "threads"},
+    "gurobi": {
+        "time_limit": "TimeLimit",
+        "mip_gap": "MIPGap",
+        "threads": "Threads",
+    },
+    "cplex": {
+        "time_limit": "timelimit",
+        "mip_gap": "mip_tolerances_mipgap",
+        "threads": "threads",
+    },
+}
+
+
+@dataclass
+class SolveStats:
+    """Statistics of a single solver run."""
+
+    backend: str
+    termination_condition: str
+    objective: Optional[float]
+    bound: Optional[float]
+    gap: Optional[float]
+    nodes: Optional[int]
+    wall_time: float
+
+    def to_dict(self) -> dict:
+        """Statistics as a flat dict, e.g. for a profile row."""
+        return asdict(self)
+
+
+class ModelSolver:
+    def __init__(
+        self,
+        backend: str = "cbc",
+        executable: str = None,
+        threads: int = None,
+        mip_gap: float = None,
+        time_limit: int = 1200,
+        tee: bool = False,
+    ) -> None:
+        """Solver for pyomo models with a configurable backend.
+
+        Persistent backends keep the model in memory, so repeated solves of the
+        same model skip writing and re-parsing it.
+
+        Parameters:
+            backend (str, optional): One of cbc, glpk, highs, gurobi or cplex.
+                Defaults to "cbc".
+            executable (str, optional): Path of the solver executable. Defaults to
+                the executable found on PATH.
+            threads (int, optional): Number of solver threads. Defaults to None.
+            mip_gap (float, optional): Relative mip gap to stop at. Defaults to None.
+            time_limit (int, optional): Time limit in seconds. Defaults to 1200.
+            tee (bool, optional): Whether to stream the solver log. Defaults to False.
+        """
+        if backend not in SOLVER_PLUGINS:
+            raise ValueError(f"Unknown solver backend: {backend}")
+        self.backend = backend
+        self.time_limit = time_limit
+        self.tee = tee
+
+        kwargs = {}
+        if backend in SOLVER_EXECUTABLES:
+            executable = executable or shutil.which(
+                SOLVER_EXECUTABLES[backend]
+            )
+            if executable:
+                kwargs["executable"] = executable
+        self.solver = pe.SolverFactory(SOLVER_PLUGINS[backend], **kwargs)
+
+        settings = {
+            "time_limit": time_limit,
+            "mip_gap": mip_gap,
+            "threads": threads,
+        }
+        for setting, value in settings.items():
+            option = SOLVER_OPTIONS[backend].get(setting)
+            if value is not None and option is not None:
+                self.solver.options[option] = value
+
+        self._instance = None
+
+    @property
+    def persistent(self) -> bool:
+        """Whether the backend keeps the model in memory between solves."""
+        return self.backend in PERSISTENT_BACKENDS
+
+    def reset(self) -> None:
+        """Load the model again into persistent solvers on the next solve."""
+        self._instance = None
+
+    def solve(
+        self, model: pe.ConcreteModel, warmstart: bool = False
+    ) -> SolveStats:
+        """Solve the model and load the solution into it.
+
+        Parameters:
+            model (pe.ConcreteModel): Model to solve.
+            warmstart (bool, optional): Pass the current variable values as initial
+                solution if the backend supports it. Defaults to False.
+
+        Returns:
+            SolveStats: Termination, objective, bound, gap, nodes and wall time.
+        """
+        start_time = time.perf_counter()
+        kwargs = {"tee": self.tee}
+        if self.backend == "highs":
+            # appsi solvers track model changes themselves between solves
+            kwargs["timelimit"] = self.time_limit
+        elif self.persistent and self._instance is not model:
+            self.solver.set_instance(model)
+            self._instance = model
+        if warmstart and self.backend in ("cbc", "gurobi", "cplex"):
+            kwargs["warmstart"] = True
+
+        results = self.solver.solve(model, **kwargs)
+
+        # persistent solvers only fill the dual suffix on request
+        dual = model.component("dual")
+        if (
+            self.backend in ("gurobi", "cplex")
+            and isinstance(dual, pe.Suffix)
+            and dual.import_enabled()
+        ):
+            self.solver.load_duals()
+        return self._solve_stats(results, time.perf_counter() - start_time)
+
+    def _solve_stats(self, results: object, wall_time: float) -> SolveStats:
+        """Extract solve statistics from pyomo solver results."""
+
+        def finite_or_none(value: object) -> Optional[float]:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return None
+            return value if isfinite(value) else None
+
+        # all models are minimisations
+        objective = finite_or_none(results.problem.upper_bound)
+        bound = finite_or_none(results.problem.lower_bound)
+        gap = None
+        if objective is not None and bound is not None:
+            gap = abs(objective - bound) / max(abs(objective), 1e-10)
+
+        try:
+            nodes = int(
+                results.solver.statistics.branch_and_bound.number_of_created_subproblems
+            )
+        except (AttributeError, TypeError, ValueError):
+            nodes = None
+
+        return SolveStats(
+            backend=self.backend,
+            termination_condition=str(results.solver.termination_condition),
+            objective=objective,
+            bound=bound,
+            gap=gap,
+            nodes=nodes,
+            wall_time=wall_time,
+        )
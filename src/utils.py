@@ -19,74 +19,60 @@ def compute_commute_and_wait_times(
     df["Wait Time"] = 0
     df["Commute Time"] = 0
 
-    # iterate over clients
-    for intervenant_id in df["ID Intervenant"].unique():
-        intervenant_data = df[df["ID Intervenant"] == intervenant_id]
-
-        # iterate over days
-        for date in intervenant_data["Date"].unique():
-            daily_data = intervenant_data[
-                intervenant_data["Date"] == date
-            ].sort_values(by="Start DateTime")
-            prev_end_time = None
-            prev_client_id = None
-
-            for index, row in daily_data.iterrows():
-                destination_id = str(row["ID Client"])
-
-                # get the right commute method
-                if kind == "license":
-                    commute_method = (
-                        row["Commute Method"]
-                        if "Commute Method" in row
-                        else "driving"
-                    )
-                else:
-                    commute_method = "driving"
-
-                if prev_client_id is None or prev_end_time is None:
-                    source_id = str(intervenant_id)
-                else:
-                    source_id = str(prev_client_id)
-
-                    # calculate wait time and add if smaller than 30 minutes
-                    wait_time = (
-                        row["Start DateTime"] - prev_end_time
-                    ).total_seconds() // 60 - commute_data_df.loc[
-                        (source_id, destination_id, commute_method),
-                        "commute_seconds",
-                    ] // 60
-                    if wait_time < 30:
-                        df.loc[index, "Wait Time"] = wait_time
-
-                # calculate commute time
-                try:
-                    commute_time = (
-                        commute_data_df.loc[
-                            (source_id, destination_id, commute_method),
-                            "commute_seconds",
-                        ]
-                        // 60
-                    )
-                    commute_meters = commute_data_df.loc[
-                        (source_id, destination_id, commute_method),
-                        "commute_meters",
-                    ]
+    # sessions of every caregiver and day in visiting order
+    order = df.dropna(subset=["ID Intervenant", "Date"]).sort_values(
+        ["ID Intervenant", "Date", "Start DateTime"], kind="stable"
+    )
+    grouped = order.groupby(["ID Intervenant", "Date"], sort=False)
+    first = (grouped.cumcount() == 0).to_numpy()
+    destination = order["ID Client"].astype(str)
+    prev_client = destination.groupby(grouped.ngroup()).shift()
+    prev_end = grouped["End DateTime"].shift()
+
+    # get the right commute method
+    if kind == "license" and "Commute Method" in df:
+        commute_method = order["Commute Method"]
+    else:
+        commute_method = "driving"
 
-                except KeyError:
-                    commute_time = 0  # Default to 0 if not found
-                    commute_meters = 0  # Default to 0 if not found
-                    print(
-                        f"Data not found for commute time: {source_id},"
-                        f"{destination_id}, {commute_method}"
-                    )
+    # the first session of the day starts at the caregiver's home
+    keys = pd.DataFrame(
+        {
+            "source": np.where(
+                first, order["ID Intervenant"].astype(str), prev_client
+            ),
+            "destination": destination,
+            "commute_method": commute_method,
+        },
+        index=order.index,
+    )
+    keys = pd.MultiIndex.from_frame(keys)
+
+    # look up all commutes at once
+    commute = commute_data_df[["commute_seconds", "commute_meters"]]
+    if not commute.index.is_unique:
+        commute = commute[~commute.index.duplicated()]
+    found = keys.isin(commute.index)
+    commute = commute.reindex(keys)
+    commute_time = np.where(
+        found, commute["commute_seconds"].to_numpy() // 60, 0
+    )
+    commute_meters = np.where(found, commute["commute_meters"].to_numpy(), 0)
+    for source_id, destination_id, method in keys[~found]:
+        print(
+            f"Data not found for commute time: {source_id},"
+            f"{destination_id}, {method}"
+        )
 
-                df.loc[index, "Commute Time"] = commute_time
-                df.loc[index, "Commute Meters"] = commute_meters
+    # add wait time if smaller than 30 minutes
+    wait_time = (
+        order["Start DateTime"] - prev_end
+    ).dt.total_seconds().to_numpy() // 60 - commute_time
+    wait_time = np.where(~first & (wait_time < 30), wait_time, 0)
 
-                # Update previous end time and client ID for next iteration
-                prev_end_time = row["End DateTime"]
-                prev_client_id = row["ID Client"]
+    df.loc[order.index, "Wait Time"] = wait_time
+    df.loc[order.index, "Commute Time"] = commute_time
+    df.loc[order.index, "Commute Meters"] = commute_meters
 
     return df
 
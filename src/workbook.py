@@ -0,0 +1,74 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Union
+
+import pandas as pd
+
+EXCEL_FILE = "data/ChallengeXHEC23022024.xlsx"
+
+
+def tables_dir(excel_file: str = EXCEL_FILE) -> Path:
+    """Directory of the Parquet tables next to the workbook."""
+    return Path(excel_file).parent / "tables"
+
+
+def workbook_hash(excel_file: str = EXCEL_FILE) -> str:
+    """Sha256 of the workbook content."""
+    return hashlib.sha256(Path(excel_file).read_bytes()).hexdigest()
+
+
+def ingest_workbook(excel_file: str = EXCEL_FILE) -> dict:
+    """Stores every sheet of the workbook as a typed Parquet table.
+
+    The workbook is only parsed again when its content hash differs from the
+    one of the stored tables. Without the workbook, the stored tables are used.
+
+    Parameters:
+    - excel_file (str): Path to the Excel file.
+
+    Returns:
+    dict: Manifest with the content hash and the sheet names in workbook order.
+    """
+    manifest_path = tables_dir(excel_file) / "manifest.json"
+    manifest = None
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+
+    if not Path(excel_file).exists():
+        if manifest is None:
+            raise FileNotFoundError(f"No workbook or tables for {excel_file}")
+        return manifest
+
+    content_hash = workbook_hash(excel_file)
+    if manifest is not None and manifest["hash"] == content_hash:
+        return manifest
+
+    print(f"Ingesting {excel_file} into {tables_dir(excel_file)}")
+    sheets = pd.read_excel(excel_file, sheet_name=None)
+    tables_dir(excel_file).mkdir(parents=True, exist_ok=True)
+    for sheet_name, df in sheets.items():
+        df.to_parquet(
+            tables_dir(excel_file) / f"{sheet_name}.parquet", index=False
+        )
+    manifest = {"hash": content_hash, "sheets": list(sheets)}
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def read_sheet(
+    sheet_name: Union[int, str] = 0, excel_file: str = EXCEL_FILE
+) -> pd.DataFrame:
+    """Reads a sheet of the workbook from its Parquet table.
+
+    Parameters:
+    - sheet_name (int | str): Position or name of the sheet, as in pd.read_excel.
+    - excel_file (str): Path to the Excel file.
+
+    Returns:
+    pd.DataFrame: Content of the sheet.
+    """
+    manifest = ingest_workbook(excel_file)
+    if isinstance(sheet_name, int):
+        sheet_name = manifest["sheets"][sheet_name]
+    return pd.read_parquet(tables_dir(excel_file) / f"{sheet_name}.parquet")